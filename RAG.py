@@ -1,310 +1,1142 @@
-from langgraph.graph import StateGraph, START, END
-from typing import TypedDict, Annotated
-from langchain_groq import ChatGroq
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
-from langgraph.graph.message import add_messages
-from langchain_core.tools import tool
-from dotenv import load_dotenv
-from langgraph.checkpoint.memory import MemorySaver
-import os
-from langchain_community.vectorstores import FAISS
-from langchain_community.tools.tavily_search import TavilySearchResults
-
-load_dotenv()
-
-
-#===========================================
-# Load FAISS DB & Reload Logic [FEATURE ADDED]
-#===========================================
-
-FAISS_DB_PATH = "vectorstore/db_faiss"
-embeddings = OpenAIEmbeddings(model='text-embedding-3-small')
-
-# Global variable for the database
-db = None
-
-def reload_vector_store():
-    """
-    Reloads the FAISS index from disk. 
-    Call this function after a new file is ingested.
-    """
-    global db
-    if os.path.exists(FAISS_DB_PATH):
-        print(f"Loading FAISS from {FAISS_DB_PATH}...")
-        try:
-            db = FAISS.load_local(
-                FAISS_DB_PATH, 
-                embeddings, 
-                allow_dangerous_deserialization=True
-            )
-            print("Vector store loaded successfully.")
-        except Exception as e:
-            print(f"Error loading vector store: {e}")
-            db = None
-    else:
-        print("Warning: No Vector DB found. Please run ingestion first.")
-        db = None 
-
-# Initial Load
-reload_vector_store()
-
-
-#===========================================
-# Class Schema
-#===========================================
-
-class Ragbot_State(TypedDict):
-    query       :   str
-    context     :   list[str]
-    metadata    :   list[dict]
-    RAG         :   bool
-    web_search  :   bool
-    model_name  :   str
-    web_context :   str
-    response    :   Annotated[list[BaseMessage], add_messages]
-
-#===========================================
-# LLM'S
-#===========================================
-
-
-llm_kimi2       =   ChatGroq(model='moonshotai/kimi-k2-instruct-0905', streaming=True, temperature=0.4)
-llm_gpt         =   ChatOpenAI(model='gpt-4.1-nano', streaming=True, temperature=0.2)
-llm_gpt_oss     =   ChatGroq(model='openai/gpt-oss-120b', streaming=True, temperature=0.3)
-llm_lamma4      =   ChatGroq(model='meta-llama/llama-4-scout-17b-16e-instruct', streaming=True, temperature=0.5)
-llm_qwen3       =   ChatGroq(model='qwen/qwen3-32b', streaming=True, temperature=0.5)
-
-def get_llm(model_name: str):
-    if model_name == "kimi2":
-        return llm_kimi2
-    elif model_name == "gpt":
-        return llm_gpt
-    elif model_name == "gpt_oss":
-        return llm_gpt_oss
-    elif model_name == "lamma4":
-        return llm_lamma4
-    elif model_name == "qwen3":
-        return llm_qwen3
-    else:
-        return llm_gpt  
-
-#===========================================
-# Search tool
-#===========================================
-
-@tool
-def tavily_search(query: str) -> dict:
-    """
-    Perform a real-time web search using Tavily.
-    """
-    try:
-        search = TavilySearchResults(max_results=2)
-        results = search.run(query)
-        return {"query": query, "results": results}
-    except Exception as e:
-        return {"error": str(e)}
-    
-#===========================================
-# fetching web context
-#===========================================
-
-def fetch_web_context(state: Ragbot_State):
-    user_query = state["query"]
-
-    enriched_query = f"""
-Fetch the latest, accurate, and up-to-date information about:
-{user_query}
-
-Focus on:
-- recent news
-- official announcements
-- verified sources
-- factual data
-"""
-
-    web_result = tavily_search.run(enriched_query)
-
-    return {
-        "web_context": str(web_result)
-    }
-
-#===========================================
-# db search
-#===========================================
-
-@tool
-def faiss_search(query: str) -> str:
-    """Search the FAISS vectorstore and return relevant documents."""
-    # Check global db variable
-    if db is None:
-        return "No documents have been uploaded yet.", []
-
-    try:
-        results = db.similarity_search(query, k=3)
-        context = "\n\n".join([doc.page_content for doc in results])
-        metadata = [doc.metadata for doc in results]
-        return context, metadata
-    except Exception as e:
-        return f"Error searching vector store: {str(e)}", []
-
-#===========================================
-# router
-#===========================================
-
-
-def router(state: Ragbot_State):
-    if state["RAG"]:
-        return "fetch_context"
-
-    if state["web_search"]:
-        return "fetch_web_context"
-
-    return "chat"
-
-#===========================================
-# fetching context
-#===========================================
-
-def fetch_context(state: Ragbot_State):
-    query = state["query"]
-    context, metadata = faiss_search.invoke({"query": query})
-    return {"context": [context], "metadata": [metadata]}
-
-
-#===========================================
-# system prompt
-#===========================================
-
-
-SYSTEM_PROMPT = SystemMessage(
-    content="""
-You are an intelligent conversational assistant and retrieval-augmented AI system built by Junaid.
-
-Your role is to:
-- Engage naturally in conversation like a friendly, helpful chatbot.
-- Answer general questions using your own knowledge when no external context is provided.
-- When relevant context is provided, use it accurately to answer user questions.
-- Seamlessly switch between casual conversation and knowledge-based answering.
-
-Guidelines:
-- If context is provided and relevant, use it as the primary source of truth.
-- If context is not provided or not relevant, respond using your general knowledge.
-- Do not hallucinate or invent information.
-- If you are unsure or the information is not available, clearly state that.
-- Be clear, concise, and helpful in all responses.
-- Maintain a natural, human-like conversational tone.
-- Never mention internal implementation details such as embeddings, vector databases, or system architecture.
-
-You are designed to provide reliable, accurate, and engaging assistance.
-"""
-)
-
-#===========================================
-# Chat function
-#===========================================
-
-def chat(state:Ragbot_State):
-    query = state['query']
-    context = state['context']
-    metadata = state['metadata']
-    web_context = state['web_context']
-    model_name = state.get('model_name', 'gpt')
-
-    history = state.get("response", [])
-
-    # [CHANGED] Updated Prompt to include History so it remembers your name
-    prompt = f"""
-You are an expert assistant designed to answer user questions using multiple information sources.
-
-Source Priority Rules (STRICT):
-1. **Conversation History**: Check if the answer was provided in previous messages (e.g., user's name, previous topics).
-2. If the provided Context contains the answer, use ONLY the Context.
-3. If the Context does not contain the answer and Web Context is available, use the Web Context.
-4. If neither Context nor Web Context contains the answer, use your general knowledge.
-5. Do NOT invent or hallucinate facts.
-6. If the answer cannot be determined, clearly say so.
-
-User Question:
-{query}
-
-Retrieved Context (Vector Database):
-{context}
-
-Metadata:
-{metadata}
-
-Web Context (Real-time Search):
-{web_context}
-
-Final Answer:
-"""
-
-    selected_llm = get_llm(model_name)
-    messages = [SYSTEM_PROMPT] + history + [HumanMessage(content=prompt)]
-    response = selected_llm.invoke(messages)
-    return {
-        'response': [
-            HumanMessage(content=query), 
-            response
-        ]
-    }
-
-#===========================================
-# Graph Declaration
-#===========================================
-
-memory = MemorySaver()
-graph = StateGraph(Ragbot_State)
-
-graph.add_node("fetch_context", fetch_context)
-graph.add_node("fetch_web_context", fetch_web_context)
-graph.add_node("chat", chat)
-
-graph.add_conditional_edges(
-    START,
-    router,
-    {
-        "fetch_context": "fetch_context",
-        "fetch_web_context": "fetch_web_context",
-        "chat": "chat"
-    }
-)
-
-graph.add_edge("fetch_context", "chat")
-graph.add_edge("fetch_web_context", "chat")
-graph.add_edge("chat", END)
-
-app = graph.compile(checkpointer=memory)
-
-
-#===========================================
-# Helper Function
-#===========================================
-
-def ask_bot(query: str, use_rag: bool = False, use_web: bool = False, thread_id: str = "1"):
-    config = {"configurable": {"thread_id": thread_id}}
-    inputs = {
-        "query": query,
-        "RAG": use_rag,
-        "web_search": use_web,
-        "context": [],
-        "metadata": [],
-        "web_context": "",
-    }
-    
-    result = app.invoke(inputs, config=config)
-    last_message = result['response'][-1]
-    
-    return last_message.content
-
-
-"""print("--- Conversation 1 ---")
-# User says hello and gives name
-response = ask_bot("Hi, my name is Junaid", thread_id="session_A")
-print(f"Bot: {response}")
-
-# User asks for name (RAG and Web are OFF)
-response = ask_bot("What is my name?", thread_id="session_A")
-
-print(f"Bot: {response}")"""
+from langgraph.graph import StateGraph, START, END
+from typing import TypedDict, Annotated
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage, RemoveMessage
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langgraph.graph.message import add_messages
+from langchain_core.tools import tool
+from dotenv import load_dotenv
+import os
+import re
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+import faiss
+import numpy as np
+from faiss_index import FAISS_MMAP, is_trained_type, load_store, append_store, attach_shard, list_delta_shards, path_lock
+from embedding_cache import EmbeddingCache, CachedQueryEmbeddings, normalize_query
+from answer_cache import SemanticAnswerCache
+from search_cache import TTLCache, SingleFlight
+from checkpointer import CHECKPOINTER, TimedMemorySaver, open_checkpointer
+from model_routing import ModelRouter, RoutedChatModel
+import metrics
+from context_packing import RETRIEVAL_K, pack_context
+from bm25 import load_or_build, reciprocal_rank_fusion
+from chat_history import (
+    HISTORY_KEEP_TURNS, count_tokens, split_turns, needs_summary,
+    flatten, summary_request, summary_message,
+)
+
+load_dotenv()
+
+
+#===========================================
+# Load FAISS DB & Reload Logic [FEATURE ADDED]
+#===========================================
+
+FAISS_DB_PATH = "vectorstore/db_faiss"
+# Every collection (team / tenant) gets its own index; the default one
+# keeps the original location so existing indexes are picked up as is.
+DEFAULT_COLLECTION = "default"
+COLLECTIONS_ROOT = "vectorstore/collections"
+COLLECTION_ID_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$"
+# Loaded collection indexes kept in memory; colder ones are dropped
+MAX_LOADED_COLLECTIONS = int(os.getenv("MAX_LOADED_COLLECTIONS", "16"))
+EMBEDDING_MODEL = 'text-embedding-3-small'
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+# Point several workers at the same file to share query embeddings
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH")
+
+def _openai_embeddings():
+    # Provider SDKs are imported on first use (or by warm_up), not at
+    # import time; they are most of this module's import cost.
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+
+# Query embeddings go through an LRU so repeated questions skip the
+# embedding round trip and go straight to the vector lookup.
+embeddings = CachedQueryEmbeddings(
+    _openai_embeddings,
+    EMBEDDING_MODEL,
+    max_size=QUERY_CACHE_SIZE,
+    disk_cache=EmbeddingCache(QUERY_CACHE_PATH) if QUERY_CACHE_PATH else None,
+)
+
+class VectorStoreHolder:
+    """
+    Double-buffered holder for the live FAISS index.
+
+    Readers take a snapshot and keep using that index even if a reload
+    swaps in a new one mid-query. Reloads (one at a time) build the next
+    index off to the side and swap it in atomically; the old one is freed
+    once the last in-flight search drops it. The generation number only
+    moves forward when an ingestion job is published, so it identifies
+    "every upload up to and including job N". It is saved with the
+    collection (see publish_generation), so an evicted collection loaded
+    again picks up where it left off.
+    """
+
+    def __init__(self, collection_id: str = DEFAULT_COLLECTION):
+        self.collection_id = collection_id
+        self._lock = threading.Lock()
+        # (store, generation, loaded delta shards) - replaced as one tuple
+        self._current = (None, 0, frozenset())
+        # Held for a whole reload (see _reload); readers never take it
+        self.reload_lock = threading.Lock()
+
+    def snapshot(self):
+        store, generation, _ = self._current
+        return store, generation
+
+    @property
+    def generation(self) -> int:
+        return self._current[1]
+
+    def loaded_deltas(self) -> frozenset:
+        return self._current[2]
+
+    def swap(self, store, loaded_deltas, generation: int = None):
+        with self._lock:
+            current_generation = self._current[1]
+            if generation is not None:
+                current_generation = max(current_generation, generation)
+            self._current = (store, current_generation, frozenset(loaded_deltas))
+
+    def publish(self, generation: int):
+        with self._lock:
+            store, current_generation, deltas = self._current
+            self._current = (store, max(current_generation, generation), deltas)
+
+
+def collection_path(collection_id: str) -> str:
+    if not re.match(COLLECTION_ID_PATTERN, collection_id or ""):
+        raise ValueError(f"Invalid collection id: {collection_id!r}")
+    if collection_id == DEFAULT_COLLECTION:
+        return FAISS_DB_PATH
+    return os.path.join(COLLECTIONS_ROOT, collection_id)
+
+def collection_exists(collection_id: str) -> bool:
+    """The default collection always exists; others once a file was uploaded to them."""
+    return collection_id == DEFAULT_COLLECTION or os.path.isdir(collection_path(collection_id))
+
+# Last published generation and last generation handed to an upload,
+# kept next to the index
+GENERATION_FILE = "generation"
+RESERVED_FILE = "generation.reserved"
+
+def _read_generation(db_path: str, name: str = GENERATION_FILE) -> int:
+    try:
+        with open(os.path.join(db_path, name)) as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def _write_generation(db_path: str, generation: int, name: str = GENERATION_FILE):
+    os.makedirs(db_path, exist_ok=True)
+    temp_path = os.path.join(db_path, f"{name}.tmp")
+    with open(temp_path, "w") as f:
+        f.write(str(generation))
+    os.replace(temp_path, os.path.join(db_path, name))
+
+def _generation_lock(db_path: str):
+    # Its own lock rather than the folder's, which compaction holds for long
+    return path_lock(os.path.join(db_path, GENERATION_FILE))
+
+def reserve_generation(collection_id: str) -> int:
+    """
+    Hands out the generation an upload will be published under. The
+    counter is saved with the collection, so numbers are never reused,
+    and the collection's index isn't loaded to get one.
+    """
+    path = collection_path(collection_id)
+    with _generation_lock(path):
+        generation = max(_read_generation(path, RESERVED_FILE), _read_generation(path)) + 1
+        _write_generation(path, generation, RESERVED_FILE)
+    return generation
+
+def publish_generation(collection_id: str, generation: int):
+    """
+    Marks an upload as fully indexed: the collection's generation moves to
+    at least `generation`, in memory if it is loaded and on disk either way.
+    """
+    path = collection_path(collection_id)
+    with _generation_lock(path):
+        generation = max(generation, _read_generation(path))
+        _write_generation(path, generation)
+        holder = collection_indexes.peek(collection_id)
+        if holder is not None:
+            holder.publish(generation)
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+# Cached RAG answers; a collection's are cleared whenever a new index of
+# it is swapped in
+answer_cache = SemanticAnswerCache(
+    max_entries=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL,
+    threshold=ANSWER_CACHE_THRESHOLD,
+)
+
+def _load_local(path, mmap: bool = False):
+    store = load_store(path, embeddings, mmap=mmap)
+    # The keyword index travels with the store, so a snapshot always pairs
+    # the FAISS index with the BM25 index over the same chunks.
+    store.keyword_index = load_or_build(path, store)
+    return store
+
+def _add_shards(store, deltas):
+    keyword_index = functools.reduce(lambda merged, delta: merged.merged(delta.keyword_index),
+                                     deltas, store.keyword_index)
+    # The deltas are searched alongside the live index rather than merged
+    # into a copy of it, so picking up shards costs the shards' size, not
+    # the index's. Compaction folds the shards into the base, and a full
+    # reload (e.g. after compaction) merges them back into one index.
+    store = attach_shard(store, *deltas)
+    store.keyword_index = keyword_index
+    return store
+
+def reload_vector_store(delta_paths: list[str] = None, generation: int = None,
+                        collection_id: str = DEFAULT_COLLECTION):
+    """
+    Reloads the FAISS index from disk. 
+    Call this function after a new file is ingested.
+
+    If delta_paths is given and an index is already loaded, only those
+    delta shards are read and attached to the live index instead of a
+    full reload. Either way the new index is swapped in atomically, so
+    searches never see a half-built index, and a failed reload keeps the
+    current one. A collection that isn't loaded is left alone; its next
+    search reads it from disk, new shards included.
+    """
+    holder = collection_indexes.peek(collection_id)
+    if holder is not None:
+        _reload(holder, collection_path(collection_id), delta_paths, generation)
+
+def _reload(vector_store, db_path: str, delta_paths: list[str] = None, generation: int = None,
+            raise_errors: bool = False):
+    """
+    Does the work of reload_vector_store for one holder. If the index on
+    disk can't be read the holder keeps what it had, and the error is
+    raised when raise_errors is set (a first load has nothing to keep).
+    A folder with no index yet is not an error.
+
+    Reloads of one holder run one at a time: each builds on what the
+    previous one swapped in, so a slow full load finishing last can't
+    drop the shards a faster reload attached meanwhile.
+    """
+    with vector_store.reload_lock:
+        _reload_serialized(vector_store, db_path, delta_paths, generation, raise_errors)
+
+def _reload_serialized(vector_store, db_path: str, delta_paths: list[str], generation: int,
+                       raise_errors: bool):
+    current, _ = vector_store.snapshot()
+    loaded = vector_store.loaded_deltas()
+
+    if delta_paths and current is not None:
+        new_paths = [path for path in delta_paths if path not in loaded]
+        if not new_paths:
+            vector_store.swap(current, loaded, generation)
+            return
+        print(f"Attaching {len(new_paths)} delta shard(s) to {db_path}...")
+        try:
+            with path_lock(db_path):
+                deltas = [_load_local(path) for path in new_paths]
+            store = _add_shards(current, deltas)
+            vector_store.swap(store, loaded | set(new_paths), generation)
+            answer_cache.clear(vector_store.collection_id)
+            print("Delta shards attached successfully.")
+            return
+        except Exception as e:
+            print(f"Error attaching delta shards, doing a full reload: {e}")
+
+    if os.path.exists(os.path.join(db_path, "index.faiss")):
+        print(f"Loading FAISS from {db_path}...")
+        try:
+            # Base and shards are read as one consistent set
+            with path_lock(db_path):
+                store = _load_local(db_path, mmap=FAISS_MMAP)
+                shards = list_delta_shards(db_path)
+                deltas = [_load_local(shard) for shard in shards]
+            if FAISS_MMAP and deltas:
+                # A memory-mapped base is read-only
+                store = _add_shards(store, deltas)
+            else:
+                # Freshly loaded, so the base can be appended to in place
+                for delta in deltas:
+                    append_store(store, delta)
+                    store.keyword_index = store.keyword_index.merged(delta.keyword_index)
+            vector_store.swap(store, shards, generation)
+            answer_cache.clear(vector_store.collection_id)
+            print("Vector store loaded successfully.")
+        except Exception as e:
+            print(f"Error loading vector store, keeping the current index: {e}")
+            if raise_errors:
+                raise
+    else:
+        print(f"Warning: No Vector DB found at {db_path}. Please run ingestion first.")
+
+class CollectionRegistry:
+    """
+    LRU of loaded collection indexes, one VectorStoreHolder each.
+
+    A search on a collection that isn't loaded reads it from disk (off
+    the event loop, once however many searches ask for it) and may push
+    the least recently used collection out. An evicted index is freed
+    once the searches still holding a snapshot of it finish. Pinned
+    collections are never evicted. A load that fails raises and leaves
+    the collection unloaded (a pinned one cold), so the next search
+    reads it again.
+    """
+
+    def __init__(self, max_loaded: int = MAX_LOADED_COLLECTIONS):
+        self.max_loaded = max_loaded
+        self._holders = OrderedDict()
+        self._pinned = set()
+        self._cold = set()      # pinned, not loaded yet
+        self._lock = threading.Lock()
+        self._load_locks = {}   # collection_id -> lock held while loading it
+        self._loads = SingleFlight()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def peek(self, collection_id: str):
+        """The loaded holder for collection_id, or None. Doesn't load."""
+        with self._lock:
+            return self._holders.get(collection_id)
+
+    def get(self, collection_id: str) -> VectorStoreHolder:
+        with self._lock:
+            holder = self._holders.get(collection_id)
+            cold = collection_id in self._cold
+            if holder is not None:
+                self._holders.move_to_end(collection_id)
+                self.hits += 1
+        if holder is None:
+            return self._load(collection_id)
+        if cold:
+            # Joins a load already running for warm() or aget()
+            self._fill(collection_id)
+        return holder
+
+    async def aget(self, collection_id: str) -> VectorStoreHolder:
+        holder = self.peek(collection_id)
+        if holder is not None:
+            await self.warm(collection_id)
+            return self.get(collection_id)
+        return await self._loads.do(collection_id, lambda: asyncio.to_thread(self._load, collection_id))
+
+    def pin(self, collection_id: str) -> VectorStoreHolder:
+        """
+        Registers a collection that is never evicted. Its holder starts
+        out empty; warm() loads it, and searches arriving before that
+        wait for the same load.
+        """
+        with self._lock:
+            holder = self._holders.get(collection_id)
+            if holder is None:
+                holder = self._holders[collection_id] = VectorStoreHolder(collection_id)
+                self._cold.add(collection_id)
+            self._pinned.add(collection_id)
+        return holder
+
+    def is_warm(self, collection_id: str) -> bool:
+        with self._lock:
+            return collection_id in self._holders and collection_id not in self._cold
+
+    async def warm(self, collection_id: str):
+        """Loads a pinned collection if it hasn't been loaded yet."""
+        with self._lock:
+            cold = collection_id in self._cold
+        if cold:
+            await self._loads.do(collection_id, lambda: asyncio.to_thread(self._fill, collection_id))
+
+    def _load_lock(self, collection_id: str) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(collection_id, threading.Lock())
+
+    def _fill(self, collection_id: str):
+        # Threads that arrive while another one loads the collection wait
+        # for it and then find it warm, so it is read from disk once
+        with self._load_lock(collection_id):
+            with self._lock:
+                if collection_id not in self._cold:
+                    return
+            holder = self.peek(collection_id)
+            path = collection_path(collection_id)
+            holder.publish(_read_generation(path))
+            # On error it stays cold, so the next search (or warm) tries again
+            _reload(holder, path, raise_errors=True)
+            with self._lock:
+                self._cold.discard(collection_id)
+                self.loads += 1
+
+    def _load(self, collection_id: str) -> VectorStoreHolder:
+        path = collection_path(collection_id)
+        with self._load_lock(collection_id):
+            holder = self.peek(collection_id)
+            if holder is not None:
+                # Loaded while this thread waited for the lock
+                return holder
+            holder = VectorStoreHolder(collection_id)
+            holder.publish(_read_generation(path))
+            # On error it isn't registered, so the next search tries again
+            _reload(holder, path, raise_errors=True)
+            with self._lock:
+                self._holders[collection_id] = holder
+                self.loads += 1
+                while len(self._holders) > self.max_loaded:
+                    victim = next((c for c in self._holders if c not in self._pinned), None)
+                    if victim is None or victim == collection_id:
+                        break
+                    del self._holders[victim]
+                    # Its answers can't be hit until it's loaded again,
+                    # which clears them anyway
+                    answer_cache.clear(victim)
+                    self.evictions += 1
+                    print(f"Evicted collection '{victim}' from memory.")
+        return holder
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": len(self._holders),
+                "max_loaded": self.max_loaded,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+collection_indexes = CollectionRegistry()
+
+# The default collection is always resident; warm_up loads it in the
+# background once the server is up
+vector_store = collection_indexes.pin(DEFAULT_COLLECTION)
+
+
+#===========================================
+# Class Schema
+#===========================================
+
+class Ragbot_State(TypedDict):
+    query       :   str
+    context     :   list[str]
+    metadata    :   list[dict]
+    RAG         :   bool
+    web_search  :   bool
+    model_name  :   str
+    web_context :   str
+    cached_answer : str
+    collection_id : str
+    summary     :   str     # running summary of turns pruned from response
+    summarized_tokens : int # tokens those pruned turns took verbatim
+    tokens_saved : int      # history tokens not sent on the last turn
+    response    :   Annotated[list[BaseMessage], add_messages]
+
+#===========================================
+# LLM'S
+#===========================================
+
+
+def _groq(model: str, temperature: float):
+    def build():
+        from langchain_groq import ChatGroq
+        return ChatGroq(model=model, streaming=True, temperature=temperature)
+    return build
+
+def _openai(model: str, temperature: float):
+    def build():
+        from langchain_openai import ChatOpenAI
+        # stream_usage: token counts arrive on the last chunk (see /chat end event)
+        return ChatOpenAI(model=model, streaming=True, stream_usage=True, temperature=temperature)
+    return build
+
+# Clients are built by the router on first use (or by warm_up)
+MODELS = {
+    "kimi2": _groq('moonshotai/kimi-k2-instruct-0905', 0.4),
+    "gpt": _openai('gpt-4.1-nano', 0.2),
+    "gpt_oss": _groq('openai/gpt-oss-120b', 0.3),
+    "lamma4": _groq('meta-llama/llama-4-scout-17b-16e-instruct', 0.5),
+    "qwen3": _groq('qwen/qwen3-32b', 0.5),
+}
+DEFAULT_MODEL = "gpt"
+
+# Models that may answer in place of each other when one is slow or
+# failing; each list crosses providers so one outage can't take out both
+MODEL_FALLBACKS = {
+    "gpt": ["gpt_oss", "kimi2"],
+    "gpt_oss": ["gpt", "kimi2"],
+    "kimi2": ["gpt_oss", "gpt"],
+    "lamma4": ["qwen3", "gpt"],
+    "qwen3": ["lamma4", "gpt"],
+}
+
+model_router = ModelRouter(MODELS, MODEL_FALLBACKS)
+routed_llms = {name: RoutedChatModel(router=model_router, model_name=name) for name in MODELS}
+
+def get_llm(model_name: str):
+    return routed_llms.get(model_name, routed_llms[DEFAULT_MODEL])
+
+#===========================================
+# Search tool
+#===========================================
+
+WEB_CACHE_TTL = float(os.getenv("WEB_CACHE_TTL", "300"))
+
+# Per-branch retrieval timeouts (seconds)
+WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", "4"))
+VECTOR_SEARCH_TIMEOUT = float(os.getenv("VECTOR_SEARCH_TIMEOUT", "5"))
+
+# One search client for the whole process, created on first use
+_search_backend = None
+
+# Identical searches within the TTL are served from memory, and
+# concurrent identical searches share a single upstream call.
+web_search_cache = TTLCache(ttl=WEB_CACHE_TTL)
+_web_search_flight = SingleFlight()
+
+def set_search_backend(backend):
+    """
+    Replaces the Tavily client with any object exposing
+    `async arun(query)`, e.g. the local stub in benchmarks/fakes.py.
+    """
+    global _search_backend
+    _search_backend = backend
+    web_search_cache.clear()
+
+def _get_search_backend():
+    global _search_backend
+    if _search_backend is None:
+        from langchain_community.tools.tavily_search import TavilySearchResults
+        _search_backend = TavilySearchResults(max_results=2)
+    return _search_backend
+
+async def _cached_search(query: str):
+    key = normalize_query(query)
+    results = web_search_cache.get(key)
+    if results is None:
+        async def search():
+            found = await _get_search_backend().arun(query)
+            web_search_cache.set(key, found)
+            return found
+        results = await _web_search_flight.do(key, search)
+    return results
+
+@tool
+async def tavily_search(query: str) -> dict:
+    """
+    Perform a real-time web search using Tavily.
+    """
+    try:
+        results = await _cached_search(query)
+        return {"query": query, "results": results}
+    except Exception as e:
+        return {"error": str(e)}
+    
+#===========================================
+# fetching web context
+#===========================================
+
+async def fetch_web_context(state: Ragbot_State):
+    user_query = state["query"]
+
+    enriched_query = f"""
+Fetch the latest, accurate, and up-to-date information about:
+{user_query}
+
+Focus on:
+- recent news
+- official announcements
+- verified sources
+- factual data
+"""
+
+    # A slow search degrades the turn to vector-only instead of stalling it;
+    # the search keeps running in the background and still fills the cache.
+    try:
+        with RETRIEVAL_SECONDS.time(stage="web"):
+            web_result = await asyncio.wait_for(tavily_search.ainvoke(enriched_query), WEB_SEARCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"Web search exceeded {WEB_SEARCH_TIMEOUT}s, answering without web context.")
+        RETRIEVAL_TIMEOUTS.inc(source="web")
+        web_result = ""
+
+    return {
+        "web_context": str(web_result)
+    }
+
+#===========================================
+# db search
+#===========================================
+
+# Fuse BM25 keyword hits with the vector hits (exact identifiers, error
+# codes and part numbers are often missed by dense retrieval alone)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+
+# Vector searches comparing the query against more vectors than this run
+# in a thread. A flat 1536-dim scan of 10k vectors takes ~6 ms (~60 ms at
+# 100k), which would stall every other stream on the event loop.
+INLINE_SEARCH_MAX_VECTORS = int(os.getenv("INLINE_SEARCH_MAX_VECTORS", "2000"))
+
+RETRIEVAL_SECONDS = metrics.histogram(
+    "cortex_retrieval_seconds",
+    "Retrieval latency by stage: collection (index lookup or load), embed, keyword, vector, documents (whole search), web",
+    ["stage"],
+)
+RETRIEVAL_TIMEOUTS = metrics.counter(
+    "cortex_retrieval_timeouts_total", "Retrievals dropped from a turn after their timeout", ["source"]
+)
+
+def _scanned_vectors(index) -> int:
+    """Roughly how many vectors one search compares the query against."""
+    if is_trained_type(index):
+        ivf = faiss.extract_index_ivf(index)
+        return index.ntotal * min(ivf.nprobe, ivf.nlist) // ivf.nlist
+    return index.ntotal
+
+def _vector_ids(db, vector, k: int) -> list[str]:
+    query = np.asarray([vector], dtype="float32")
+    if db._normalize_L2:
+        faiss.normalize_L2(query)
+    _, indices = db.index.search(query, k)
+    return [db.index_to_docstore_id[i] for i in indices[0] if i != -1]
+
+def _keyword_ids(db, query: str, k: int) -> list[str]:
+    keyword_index = getattr(db, "keyword_index", None)
+    if not HYBRID_SEARCH or keyword_index is None:
+        return []
+    return [id_ for id_, _ in keyword_index.search(query, k)]
+
+@tool
+async def faiss_search(query: str, collection_id: str = DEFAULT_COLLECTION) -> str:
+    """Search the FAISS vectorstore and return relevant documents."""
+    start = time.perf_counter()
+    if not collection_exists(collection_id):
+        # Not loaded, so a typo can't push a hot collection out of memory
+        return "No documents have been uploaded to this collection yet.", []
+    # Pin the collection's current index; a concurrent reload swaps in a
+    # new one without affecting this search.
+    try:
+        with RETRIEVAL_SECONDS.time(stage="collection"):
+            holder = await collection_indexes.aget(collection_id)
+    except Exception as e:
+        return f"Error loading vector store: {str(e)}", []
+    db, _ = holder.snapshot()
+    if db is None:
+        return "No documents have been uploaded yet.", []
+
+    try:
+        # BM25 runs while the query embedding request is in flight, so the
+        # keyword side adds next to nothing to the turn's latency.
+        embed_start = time.perf_counter()
+        embedding = asyncio.ensure_future(embeddings.aembed_query(query))
+        embedding.add_done_callback(
+            lambda _: RETRIEVAL_SECONDS.observe(time.perf_counter() - embed_start, stage="embed")
+        )
+        await asyncio.sleep(0)   # let the request go out before BM25 takes the loop
+        try:
+            with RETRIEVAL_SECONDS.time(stage="keyword"):
+                keyword_ids = _keyword_ids(db, query, RETRIEVAL_K)
+        finally:
+            vector = await embedding
+        # Small indexes are searched inline; a thread hop would cost more
+        # than the scan. FAISS releases the GIL while it searches.
+        # Over-fetch; packing drops overlap and keeps what fits the budget.
+        with RETRIEVAL_SECONDS.time(stage="vector"):
+            if _scanned_vectors(db.index) <= INLINE_SEARCH_MAX_VECTORS:
+                ids = _vector_ids(db, vector, RETRIEVAL_K)
+            else:
+                ids = await asyncio.to_thread(_vector_ids, db, vector, RETRIEVAL_K)
+        if keyword_ids:
+            ids = reciprocal_rank_fusion(ids, keyword_ids)[:RETRIEVAL_K]
+        results = [db.docstore.search(id_) for id_ in ids]
+        context, citations, stats = pack_context(results)
+        _record_packing(stats)
+        RETRIEVAL_SECONDS.observe(time.perf_counter() - start, stage="documents")
+        return context, citations
+    except Exception as e:
+        return f"Error searching vector store: {str(e)}", []
+
+context_stats = {"searches": 0, "chunks": 0, "passages": 0, "raw_tokens": 0, "packed_tokens": 0}
+
+def _record_packing(stats: dict):
+    context_stats["searches"] += 1
+    for key, value in stats.items():
+        context_stats[key] += value
+
+def get_cache_stats():
+    return {
+        "collections": collection_indexes.stats(),
+        "models": model_router.summary(),
+        "context": dict(context_stats),
+        "history": dict(history_stats),
+        "query_embeddings": embeddings.stats(),
+        "answers": answer_cache.stats(),
+        "web_search": {**web_search_cache.stats(), "coalesced": _web_search_flight.coalesced},
+    }
+
+#===========================================
+# router
+#===========================================
+
+
+async def router(state: Ragbot_State):
+    # Both sources: fan out, the two retrievals run in the same step and
+    # join at check_answer_cache before chat.
+    if state["RAG"] and state["web_search"]:
+        return ["fetch_context", "fetch_web_context"]
+
+    if state["RAG"]:
+        return "fetch_context"
+
+    if state["web_search"]:
+        return "fetch_web_context"
+
+    return "chat"
+
+#===========================================
+# fetching context
+#===========================================
+
+# Set by /chat/batch to a dict shared by the batch's items, so duplicate
+# queries against the same collection retrieve once.
+retrieval_memo = contextvars.ContextVar("retrieval_memo", default=None)
+
+def _search_collection(query: str, collection_id: str):
+    memo = retrieval_memo.get()
+    if memo is None:
+        return faiss_search.ainvoke({"query": query, "collection_id": collection_id})
+    key = (collection_id, normalize_query(query))
+    if key not in memo:
+        memo[key] = asyncio.ensure_future(faiss_search.ainvoke({"query": query, "collection_id": collection_id}))
+    # Shielded: one item timing out mustn't cancel the search for the rest
+    return asyncio.shield(memo[key])
+
+async def fetch_context(state: Ragbot_State):
+    query = state["query"]
+    collection_id = state.get("collection_id") or DEFAULT_COLLECTION
+    try:
+        # A cold collection is loaded inside this timeout; if it runs out
+        # the load still finishes in the background for the next turn.
+        context, metadata = await asyncio.wait_for(
+            _search_collection(query, collection_id), VECTOR_SEARCH_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        print(f"Vector search exceeded {VECTOR_SEARCH_TIMEOUT}s, answering without document context.")
+        RETRIEVAL_TIMEOUTS.inc(source="documents")
+        context, metadata = "", []
+    return {"context": [context], "metadata": [metadata]}
+
+
+#===========================================
+# answer cache
+#===========================================
+
+def _history_messages(state: Ragbot_State) -> list[BaseMessage]:
+    """
+    The summary plus every turn it doesn't cover yet. Folded turns are
+    removed from the checkpoint, so nothing is dropped unsummarized;
+    summarize_thread keeps what is left within the budget.
+    """
+    return summary_message(state.get("summary", "")) + state.get("response", [])
+
+async def _answer_cache_key(state: Ragbot_State):
+    # The query embedding is already in the LRU from the vector search
+    vector = await embeddings.aembed_query(state["query"])
+    collection_id = state.get("collection_id") or DEFAULT_COLLECTION
+    holder = collection_indexes.peek(collection_id)
+    retrieved = f"{state['context']}\x00{state['metadata']}\x00{state.get('web_context', '')}"
+    # The history is part of the prompt, so an answer is only reused by a
+    # conversation that has the same one (in practice: new threads)
+    conversation = "\x00".join(f"{m.type}:{m.content}" for m in _history_messages(state))
+    bucket = SemanticAnswerCache.make_bucket(
+        collection_id, retrieved, state.get("model_name", "gpt"), holder.generation if holder else 0, conversation
+    )
+    return vector, bucket
+
+async def check_answer_cache(state: Ragbot_State):
+    # Web-only turns pass through here too (it's the retrieval join point)
+    if not state.get("RAG"):
+        return {"cached_answer": ""}
+    vector, bucket = await _answer_cache_key(state)
+    return {"cached_answer": answer_cache.lookup(vector, bucket) or ""}
+
+async def route_after_cache(state: Ragbot_State):
+    if state.get("cached_answer"):
+        return "replay_answer"
+    return "chat"
+
+async def replay_answer(state: Ragbot_State):
+    # Stream the cached answer through a chat model so /chat receives the
+    # same on_chat_model_stream events as for a live answer.
+    replay_llm = GenericFakeChatModel(messages=iter([AIMessage(content=state["cached_answer"])]))
+    response = await replay_llm.ainvoke(state["query"])
+    return {
+        'response': [
+            HumanMessage(content=state["query"]),
+            response
+        ]
+    }
+
+#===========================================
+# system prompt
+#===========================================
+
+
+SYSTEM_PROMPT = SystemMessage(
+    content="""
+You are an intelligent conversational assistant and retrieval-augmented AI system built by Junaid.
+
+Your role is to:
+- Engage naturally in conversation like a friendly, helpful chatbot.
+- Answer general questions using your own knowledge when no external context is provided.
+- When relevant context is provided, use it accurately to answer user questions.
+- Seamlessly switch between casual conversation and knowledge-based answering.
+
+Guidelines:
+- If context is provided and relevant, use it as the primary source of truth.
+- If context is not provided or not relevant, respond using your general knowledge.
+- Do not hallucinate or invent information.
+- If you are unsure or the information is not available, clearly state that.
+- Be clear, concise, and helpful in all responses.
+- Maintain a natural, human-like conversational tone.
+- Never mention internal implementation details such as embeddings, vector databases, or system architecture.
+
+You are designed to provide reliable, accurate, and engaging assistance.
+"""
+)
+
+#===========================================
+# Chat function
+#===========================================
+
+async def chat(state:Ragbot_State):
+    query = state['query']
+    # Packed passages, each headed by a short citation like "[1] manual.pdf, p. 4"
+    context = "\n\n".join(state['context'])
+    web_context = state['web_context']
+    model_name = state.get('model_name', 'gpt')
+
+    # Turns not folded into the running summary yet go out verbatim
+    history = state.get("response", [])
+    context_messages = _history_messages(state)
+
+    # [CHANGED] Updated Prompt to include History so it remembers your name
+    prompt = f"""
+You are an expert assistant designed to answer user questions using multiple information sources.
+
+Source Priority Rules (STRICT):
+1. **Conversation History**: Check if the answer was provided in previous messages (e.g., user's name, previous topics).
+2. If the provided Context contains the answer, use ONLY the Context.
+3. If the Context does not contain the answer and Web Context is available, use the Web Context.
+4. If neither Context nor Web Context contains the answer, use your general knowledge.
+5. Do NOT invent or hallucinate facts.
+6. If the answer cannot be determined, clearly say so.
+
+User Question:
+{query}
+
+Retrieved Context (Vector Database):
+{context}
+
+Web Context (Real-time Search):
+{web_context}
+
+Final Answer:
+"""
+
+    selected_llm = get_llm(model_name)
+    messages = [SYSTEM_PROMPT] + context_messages + [HumanMessage(content=prompt)]
+    PROMPT_TOKENS.observe(count_tokens(messages))
+    response = await selected_llm.ainvoke(messages)
+
+    if state.get("RAG") and response.content:
+        vector, bucket = await _answer_cache_key(state)
+        answer_cache.store(vector, bucket, response.content)
+
+    full_tokens = state.get("summarized_tokens", 0) + count_tokens(history)
+    tokens_saved = max(0, full_tokens - count_tokens(context_messages))
+    _record_history(count_tokens(context_messages), tokens_saved)
+
+    return {
+        'response': [
+            HumanMessage(content=query), 
+            response
+        ],
+        'tokens_saved': tokens_saved,
+    }
+
+#===========================================
+# History summarization
+#===========================================
+
+history_stats = {"turns": 0, "history_tokens_sent": 0, "history_tokens_saved": 0, "summaries": 0}
+
+def _record_history(sent: int, saved: int):
+    history_stats["turns"] += 1
+    history_stats["history_tokens_sent"] += sent
+    history_stats["history_tokens_saved"] += saved
+
+async def summarize_history(state: Ragbot_State):
+    """
+    Once the verbatim history outgrows the budget, folds everything but the
+    last HISTORY_KEEP_TURNS turns into the running summary and returns the
+    state update that removes those messages. Not a graph node: it runs
+    off the request path, through summarize_thread.
+    """
+    turns = split_turns(state.get("response", []))
+    if not needs_summary(turns):
+        return {}
+
+    folded = turns[:-HISTORY_KEEP_TURNS] if HISTORY_KEEP_TURNS else turns
+    if not folded:
+        return {}
+
+    summarizer = get_llm(state.get("model_name", "gpt"))
+    try:
+        result = await summarizer.ainvoke(summary_request(state.get("summary", ""), folded))
+    except Exception as e:
+        print(f"Error summarizing history, keeping it verbatim: {e}")
+        return {}
+
+    history_stats["summaries"] += 1
+    return {
+        "summary": result.content,
+        "summarized_tokens": state.get("summarized_tokens", 0) + count_tokens(flatten(folded)),
+        "response": [RemoveMessage(id=message.id) for message in flatten(folded)],
+    }
+
+#===========================================
+# Metrics
+#===========================================
+
+NODE_SECONDS = metrics.histogram("cortex_graph_node_seconds", "Time spent in each graph node", ["node"])
+PROMPT_TOKENS = metrics.histogram(
+    "cortex_prompt_tokens", "Estimated tokens sent to the LLM per answer",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000, 32000),
+)
+
+def _timed_node(name: str, node):
+    @functools.wraps(node)
+    async def timed(state: Ragbot_State):
+        with NODE_SECONDS.time(node=name):
+            return await node(state)
+    return timed
+
+def _cache_counts(field: str) -> dict:
+    return {
+        "query_embedding": embeddings.stats()[field],
+        "answer": answer_cache.stats()[field],
+        "web_search": web_search_cache.stats()[field],
+        "collection": collection_indexes.stats()["hits" if field == "hits" else "loads"],
+    }
+
+# Read from the stats these components already keep, at scrape time
+metrics.observed("cortex_cache_hits_total", "Cache hits by cache", "counter",
+                 lambda: _cache_counts("hits"), ["cache"])
+metrics.observed("cortex_cache_misses_total", "Cache misses by cache (collection: index loads)", "counter",
+                 lambda: _cache_counts("misses"), ["cache"])
+metrics.observed("cortex_query_embedding_disk_hits_total", "Query embeddings served from the shared disk cache",
+                 "counter", lambda: embeddings.stats()["disk_hits"])
+metrics.observed("cortex_web_search_coalesced_total", "Web searches that joined an identical in-flight search",
+                 "counter", lambda: _web_search_flight.coalesced)
+metrics.observed("cortex_collections_loaded", "Collection indexes held in memory", "gauge",
+                 lambda: collection_indexes.stats()["loaded"])
+metrics.observed("cortex_context_tokens_total", "Retrieved chunk tokens before (raw) and after (packed) packing",
+                 "counter", lambda: {"raw": context_stats["raw_tokens"], "packed": context_stats["packed_tokens"]},
+                 ["kind"])
+metrics.observed("cortex_history_tokens_total", "History tokens sent to the LLM, and saved by summarization",
+                 "counter", lambda: {"sent": history_stats["history_tokens_sent"],
+                                     "saved": history_stats["history_tokens_saved"]}, ["kind"])
+metrics.observed("cortex_history_summaries_total", "History summarizations", "counter",
+                 lambda: history_stats["summaries"])
+metrics.observed("cortex_llm_hedges_total", "Hedged second requests sent to a fallback model", "counter",
+                 lambda: model_router.hedges)
+metrics.observed("cortex_llm_failovers_total", "Requests retried on a fallback model after an error", "counter",
+                 lambda: model_router.failovers)
+
+#===========================================
+# Graph Declaration
+#===========================================
+
+# In-process until the server opens the configured checkpointer (SQLite
+# with idle-thread eviction by default) with use_checkpointer
+memory = TimedMemorySaver()
+graph = StateGraph(Ragbot_State)
+
+graph.add_node("fetch_context", _timed_node("fetch_context", fetch_context))
+graph.add_node("fetch_web_context", _timed_node("fetch_web_context", fetch_web_context))
+graph.add_node("check_answer_cache", _timed_node("check_answer_cache", check_answer_cache))
+graph.add_node("replay_answer", _timed_node("replay_answer", replay_answer))
+graph.add_node("chat", _timed_node("chat", chat))
+
+graph.add_conditional_edges(
+    START,
+    router,
+    {
+        "fetch_context": "fetch_context",
+        "fetch_web_context": "fetch_web_context",
+        "chat": "chat"
+    }
+)
+
+graph.add_edge("fetch_context", "check_answer_cache")
+graph.add_conditional_edges(
+    "check_answer_cache",
+    route_after_cache,
+    {
+        "replay_answer": "replay_answer",
+        "chat": "chat"
+    }
+)
+graph.add_edge("fetch_web_context", "check_answer_cache")
+graph.add_edge("replay_answer", END)
+graph.add_edge("chat", END)
+
+app = graph.compile(checkpointer=memory)
+
+
+#===========================================
+# Startup warm-up
+#===========================================
+
+warm_up_status = {"index": False, "checkpointer": False, "clients": False, "seconds": None, "errors": {}}
+
+def is_ready() -> bool:
+    """
+    True once warm_up has finished with the checkpointer open. An index or
+    client that failed to warm is loaded again on first use, so neither
+    holds readiness back; their errors are reported by /ready.
+    """
+    return warm_up_status["seconds"] is not None and warm_up_status["checkpointer"]
+
+@asynccontextmanager
+async def use_checkpointer(kind: str = CHECKPOINTER):
+    """Runs the graph on the configured checkpointer until exit, then closes it."""
+    global memory
+    previous = memory
+    async with open_checkpointer(kind) as saver:
+        memory = app.checkpointer = saver
+        warm_up_status["checkpointer"] = True
+        try:
+            yield saver
+        finally:
+            memory = app.checkpointer = previous
+            warm_up_status["checkpointer"] = False
+
+def _build_clients():
+    embeddings.underlying
+    for name in MODELS:
+        model_router.model(name)
+
+async def _warm_step(name: str, step):
+    try:
+        await step()
+        warm_up_status[name] = True
+    except Exception as e:
+        warm_up_status["errors"][name] = str(e)
+        print(f"Warm-up step '{name}' failed: {e}")
+
+async def warm_up():
+    """
+    Does the work importing this module no longer does: loads the default
+    index and builds the embedding and chat
+    clients, so the first request doesn't pay for them. Meant to run in
+    the background once the server accepts connections. A failing step is
+    logged and recorded in warm_up_status["errors"]; the others still run.
+    """
+    start = time.perf_counter()
+    await asyncio.gather(
+        _warm_step("index", lambda: collection_indexes.warm(DEFAULT_COLLECTION)),
+        _warm_step("clients", lambda: asyncio.to_thread(_build_clients)),
+    )
+    warm_up_status["seconds"] = round(time.perf_counter() - start, 2)
+    failed = ", ".join(warm_up_status["errors"]) or "none"
+    print(f"Warm-up finished in {warm_up_status['seconds']}s (failed steps: {failed}).")
+
+
+#===========================================
+# Background summarization
+#===========================================
+
+# Summaries are written after a turn has streamed, so the summarization
+# call never holds a /chat stream open. One task per thread; the thread's
+# next turn waits for it, so two writers never race on its checkpoint.
+_summary_tasks = {}
+
+async def summarize_thread(thread_id: str):
+    """Folds a thread's older turns into its summary if they outgrew the budget."""
+    config = {"configurable": {"thread_id": thread_id}}
+    try:
+        with NODE_SECONDS.time(node="summarize_history"):
+            snapshot = await app.aget_state(config)
+            update = await summarize_history(snapshot.values)
+            if update:
+                await app.aupdate_state(config, update, as_node="chat")
+    except Exception as e:
+        print(f"Error summarizing thread {thread_id}: {e}")
+
+def summarize_in_background(thread_id: str) -> asyncio.Task:
+    task = _summary_tasks.get(thread_id)
+    if task is None or task.done():
+        task = asyncio.create_task(summarize_thread(thread_id))
+        _summary_tasks[thread_id] = task
+        task.add_done_callback(
+            lambda done: _summary_tasks.pop(thread_id, None) if _summary_tasks.get(thread_id) is done else None
+        )
+    return task
+
+async def wait_for_summary(thread_id: str):
+    """Waits for the thread's pending summarization, if there is one."""
+    task = _summary_tasks.get(thread_id)
+    if task is not None:
+        await asyncio.shield(task)
+
+
+#===========================================
+# Helper Function
+#===========================================
+
+async def aask_bot(query: str, use_rag: bool = False, use_web: bool = False, thread_id: str = "1",
+                   collection_id: str = DEFAULT_COLLECTION):
+    config = {"configurable": {"thread_id": thread_id}}
+    inputs = {
+        "query": query,
+        "RAG": use_rag,
+        "web_search": use_web,
+        "collection_id": collection_id,
+        "context": [],
+        "metadata": [],
+        "web_context": "",
+    }
+    
+    await wait_for_summary(thread_id)
+    result = await app.ainvoke(inputs, config=config)
+    last_message = result['response'][-1]
+    # Nothing is streamed here, so the history is folded before returning
+    await summarize_thread(thread_id)
+    
+    return last_message.content
+
+
+def ask_bot(query: str, use_rag: bool = False, use_web: bool = False, thread_id: str = "1",
+            collection_id: str = DEFAULT_COLLECTION):
+    """Blocking aask_bot for scripts; not for use inside a running event loop."""
+    return asyncio.run(aask_bot(query, use_rag, use_web, thread_id, collection_id))
+
+
+"""print("--- Conversation 1 ---")
+# User says hello and gives name
+response = ask_bot("Hi, my name is Junaid", thread_id="session_A")
+print(f"Bot: {response}")
+
+# User asks for name (RAG and Web are OFF)
+response = ask_bot("What is my name?", thread_id="session_A")
+
+print(f"Bot: {response}")"""
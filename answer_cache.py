@@ -0,0 +1,105 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+import numpy as np
+
+
+#===========================================
+# Semantic answer cache
+#===========================================
+
+class SemanticAnswerCache:
+    """
+    Caches final answers for RAG turns.
+
+    An entry only matches when the collection, the retrieved context, the
+    model, the index generation and the conversation history are identical
+    (the "bucket") and the new query's
+    embedding is within `threshold` cosine similarity of the cached one,
+    so paraphrases of the same question over the same passages reuse the
+    answer. Entries expire after `ttl` seconds and the least recently used
+    ones are evicted past `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()          # entry_id -> (bucket, vector, answer, expires_at)
+        self._buckets = defaultdict(set)       # bucket -> entry_ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_bucket(collection_id: str, context: str, model_name: str, generation: int, history: str = "") -> tuple:
+        context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        history_hash = hashlib.sha256(history.encode("utf-8")).hexdigest()
+        return (collection_id, context_hash, model_name, generation, history_hash)
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype="float32")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, entry_id):
+        bucket = self._entries.pop(entry_id)[0]
+        ids = self._buckets[bucket]
+        ids.discard(entry_id)
+        if not ids:
+            del self._buckets[bucket]
+
+    def lookup(self, vector, bucket: tuple):
+        """Returns the best cached answer for this bucket, or None."""
+        query = self._unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._buckets.get(bucket, ())):
+                _, cached, _, expires_at = self._entries[entry_id]
+                if expires_at < now:
+                    self._drop(entry_id)
+                    continue
+                score = float(np.dot(query, cached))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][2]
+
+    def store(self, vector, bucket: tuple, answer: str):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (bucket, self._unit(vector), answer, time.monotonic() + self.ttl)
+            self._buckets[bucket].add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self, collection_id: str = None):
+        """Drops every entry, or only those of one collection."""
+        with self._lock:
+            if collection_id is None:
+                self._entries.clear()
+                self._buckets.clear()
+                return
+            for bucket in [b for b in self._buckets if b[0] == collection_id]:
+                for entry_id in list(self._buckets[bucket]):
+                    self._drop(entry_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
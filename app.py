@@ -1,119 +1,424 @@
-import os
-import shutil
-from fastapi.responses import FileResponse
-import asyncio
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from utils import STT, TTS
-from data_ingestion import Ingest_Data 
-from RAG import app as rag_app, Ragbot_State, reload_vector_store
-
-app = FastAPI(title="LangGraph RAG Chatbot", version="1.0")
-
-# --- Pydantic Models ---
-class ChatRequest(BaseModel):
-    query: str
-    thread_id: str = "default_user"
-    use_rag: bool = False
-    use_web: bool = False
-    model_name: str = "gpt"
-
-class TTSRequest(BaseModel):
-    text: str
-    voice: str = "en-US-AriaNeural"
-
-
-# --- Endpoints ---
-
-@app.get("/")
-def health_check():
-    return {"status": "running", "message": "Bot is ready"}
-
-@app.post("/upload")
-async def upload_document(
-    file: UploadFile = File(...), 
-    background_tasks: BackgroundTasks = BackgroundTasks()
-):
-    try:
-        temp_filename = f"temp_{file.filename}"
-
-        with open(temp_filename, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        def process_and_reload(path):
-            try:
-                result = Ingest_Data(path)
-                print(f"Ingestion Result: {result}")
-                reload_vector_store()
-                
-            except Exception as e:
-                print(f"Error processing background task: {e}")
-            finally:
-                if os.path.exists(path):
-                    os.remove(path)
-
-        background_tasks.add_task(process_and_reload, temp_filename)
-
-        return {
-            "message": "File received. Processing started in background.", 
-            "filename": file.filename
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Earlier i was using a function which was streaming fine on localhost but wasn't workng once i uploaded it on hf so i switched to non-streaming.
-@app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
-    config = {"configurable": {"thread_id": request.thread_id}}
-    
-    inputs = {
-        "query": request.query,
-        "RAG": request.use_rag,
-        "web_search": request.use_web,
-        "model_name": request.model_name,
-        "context": [],
-        "metadata": [],
-        "web_context": "",
-    }
-
-    async def event_generator():
-        async for event in rag_app.astream_events(inputs, config=config, version="v1"):
-            kind = event["event"]
-            if kind == "on_chat_model_stream":
-                content = event["data"]["chunk"].content
-                
-                if content:
-                    data = content.replace("\n", "\\n")
-                    yield f"data: {data}\n\n"
-
-    return StreamingResponse(
-        event_generator(), 
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
-    )
-
-
-# ---------------- STT ---------------- #
-@app.post("/stt")
-async def transcribe_audio(file: UploadFile = File(...)):
-    try:
-        return await STT(file)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# ---------------- TTS ---------------- #
-@app.post("/tts")
-async def text_to_speech(req: TTSRequest):
-    try:
-        audio_path = await TTS(req.text, req.voice)
-        return FileResponse(audio_path, media_type="audio/mpeg", filename="output.mp3")
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
+import os
+import json
+import time
+import shutil
+from fastapi.responses import FileResponse
+import asyncio
+from uuid import uuid4
+from contextlib import asynccontextmanager, suppress
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from pydantic import BaseModel, Field
+from langchain_core.messages import AIMessageChunk
+from langchain_core.messages.ai import add_usage
+from utils import STT, TTS, stream_TTS, tts_stats, UploadTooLarge
+from RAG import (
+    app as rag_app, Ragbot_State, reload_vector_store, vector_store, get_cache_stats,
+    collection_path, collection_exists, reserve_generation, publish_generation, DEFAULT_COLLECTION, COLLECTION_ID_PATTERN,
+    embeddings, retrieval_memo, warm_up, warm_up_status, is_ready, summarize_in_background, wait_for_summary,
+    use_checkpointer,
+)
+import metrics
+
+warm_up_task = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The checkpointer is open before the first request and closed on
+    # shutdown. The warm-up isn't awaited: the server accepts connections
+    # (and answers "/") while the index loads; "/ready" reports when it's done.
+    global warm_up_task
+    async with use_checkpointer():
+        warm_up_task = asyncio.create_task(warm_up())
+        try:
+            yield
+        finally:
+            warm_up_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await warm_up_task
+
+app = FastAPI(title="LangGraph RAG Chatbot", version="1.0", lifespan=lifespan)
+
+# Ingestion jobs (PDF parsing, embedding, index reloads) run here, off the
+# request path.
+ingest_executor = ThreadPoolExecutor(max_workers=1)
+
+CHAT_REQUESTS = metrics.counter(
+    "cortex_chat_requests_total", "/chat streams by outcome (ok, error, disconnected)", ["outcome"]
+)
+CHAT_TTFT = metrics.histogram("cortex_chat_ttft_seconds", "Time from a /chat request to its first streamed token")
+CHAT_SECONDS = metrics.histogram("cortex_chat_seconds", "Duration of /chat streams")
+CHAT_TOKENS = metrics.counter("cortex_chat_streamed_tokens_total", "Token events streamed to /chat clients")
+CHAT_FRAMES = metrics.counter("cortex_chat_sse_frames_total", "SSE frames sent to /chat clients, end events included")
+
+# --- Pydantic Models ---
+class ChatRequest(BaseModel):
+    query: str
+    thread_id: str = "default_user"
+    use_rag: bool = False
+    use_web: bool = False
+    model_name: str = "gpt"
+    collection_id: str = Field(DEFAULT_COLLECTION, pattern=COLLECTION_ID_PATTERN)
+
+class BatchChatItem(BaseModel):
+    query: str
+    id: str | None = None
+
+class BatchChatRequest(BaseModel):
+    items: list[BatchChatItem] = Field(..., min_length=1, max_length=10000)
+    use_rag: bool = True
+    use_web: bool = False
+    model_name: str = "gpt"
+    collection_id: str = Field(DEFAULT_COLLECTION, pattern=COLLECTION_ID_PATTERN)
+    concurrency: int = Field(8, ge=1, le=64)
+
+class TTSRequest(BaseModel):
+    text: str
+    voice: str = "en-US-AriaNeural"
+    # Send audio chunks as they're synthesized instead of a finished file
+    stream: bool = False
+
+
+# --- Endpoints ---
+
+@app.get("/")
+def health_check():
+    return {"status": "running", "message": "Bot is ready", "index_generation": vector_store.generation}
+
+@app.get("/ready")
+def readiness_check():
+    status = {"ready": is_ready(), **warm_up_status}
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {**get_cache_stats(), "tts": tts_stats()}
+
+@app.post("/upload")
+async def upload_document(
+    file: UploadFile = File(...),
+    collection_id: str = Form(DEFAULT_COLLECTION, pattern=COLLECTION_ID_PATTERN),
+):
+    try:
+        temp_filename = f"temp_{uuid4().hex}_{file.filename}"
+
+        with open(temp_filename, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+
+        # Every index swap made while ingesting this file keeps the old
+        # generation; once the file is fully indexed it is published
+        # under this number. Reserving doesn't load the collection.
+        generation = await asyncio.to_thread(reserve_generation, collection_id)
+
+        def process_and_reload(path, generation):
+            try:
+                # Imported here: the ingestion stack (PDF loaders, splitters,
+                # embeddings client) is only needed once a file arrives.
+                from data_ingestion import Ingest_Data
+                # Streamed ingestion keeps memory flat on big PDFs and makes
+                # the first window searchable as soon as it is saved; later
+                # windows are attached in batches of STREAM_RELOAD_WINDOWS.
+                result = Ingest_Data(
+                    path,
+                    vector_db_path=collection_path(collection_id),
+                    streaming=True,
+                    on_window=lambda delta_paths: reload_vector_store(delta_paths, collection_id=collection_id),
+                )
+                print(f"Ingestion Result: {result}")
+                if result.get("status") == "success":
+                    publish_generation(collection_id, generation)
+                
+            except Exception as e:
+                print(f"Error processing background task: {e}")
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)
+
+        # Single worker: jobs run in upload order, so generation N always
+        # contains every file uploaded before it.
+        ingest_executor.submit(process_and_reload, temp_filename, generation)
+
+        return {
+            "message": "File received. Processing started in background.", 
+            "filename": file.filename,
+            "collection_id": collection_id,
+            "generation": generation,
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Earlier i was using a function which was streaming fine on localhost but wasn't workng once i uploaded it on hf so i switched to non-streaming.
+# Nodes whose model output is the answer
+STREAM_NODES = ("chat", "replay_answer")
+
+# After the first token, tokens are coalesced into one SSE frame until it
+# holds STREAM_FLUSH_CHARS characters or its oldest token has waited
+# STREAM_FLUSH_MS. STREAM_FLUSH_MS=0 sends every token as its own frame.
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "64"))
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "20"))
+
+def _sse(data: str, event: str = None) -> str:
+    data = data.replace("\n", "\\n")
+    if event:
+        return f"event: {event}\ndata: {data}\n\n"
+    return f"data: {data}\n\n"
+
+async def _answer_chunks(inputs: dict, config: dict, queue: asyncio.Queue):
+    """
+    Runs the graph in "messages" mode, which only reports LLM message
+    chunks (not every chain, node and tool start/end like astream_events),
+    and queues the answer's chunks, then None, or the error. The thread's
+    history is summarized once the answer is complete, in the background.
+    """
+    thread_id = config["configurable"]["thread_id"]
+    try:
+        await wait_for_summary(thread_id)
+        async for chunk, meta in rag_app.astream(inputs, config=config, stream_mode="messages"):
+            # Whole messages are also reported when a node returns them
+            if isinstance(chunk, AIMessageChunk) and meta.get("langgraph_node") in STREAM_NODES:
+                queue.put_nowait(chunk)
+        queue.put_nowait(None)
+        summarize_in_background(thread_id)
+    except Exception as e:
+        queue.put_nowait(e)
+
+def _require_collection(collection_id: str, use_rag: bool):
+    # Loading a collection that doesn't exist would only evict a real one
+    if use_rag and not collection_exists(collection_id):
+        raise HTTPException(status_code=404, detail=f"Unknown collection: {collection_id}")
+
+@app.post("/chat")
+async def chat_endpoint(request: ChatRequest):
+    _require_collection(request.collection_id, request.use_rag)
+    config = {"configurable": {"thread_id": request.thread_id}}
+    
+    inputs = {
+        "query": request.query,
+        "RAG": request.use_rag,
+        "web_search": request.use_web,
+        "model_name": request.model_name,
+        "collection_id": request.collection_id,
+        "context": [],
+        "metadata": [],
+        "web_context": "",
+    }
+
+    start = time.perf_counter()
+
+    async def event_generator():
+        queue = asyncio.Queue()
+        pump = asyncio.create_task(_answer_chunks(inputs, config, queue))
+        first_token, tokens, frames, usage, outcome = None, 0, 0, None, "disconnected"
+        buffer, buffered, buffered_at = [], 0, 0.0
+        try:
+            while True:
+                if not buffer or not queue.empty():
+                    item = await queue.get()
+                else:
+                    # Wait for the next token only until the frame is due
+                    remaining = STREAM_FLUSH_MS / 1000 - (time.perf_counter() - buffered_at)
+                    try:
+                        if remaining <= 0:
+                            raise TimeoutError
+                        async with asyncio.timeout(remaining):
+                            item = await queue.get()
+                    except TimeoutError:
+                        frames += 1
+                        yield _sse("".join(buffer))
+                        buffer, buffered = [], 0
+                        continue
+
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if item.usage_metadata:
+                    usage = add_usage(usage, item.usage_metadata)
+                content = item.content
+                if not content:
+                    continue
+
+                tokens += 1
+                if first_token is None:
+                    # The first token goes out on its own, so TTFT isn't delayed
+                    first_token = time.perf_counter()
+                    CHAT_TTFT.observe(first_token - start)
+                    frames += 1
+                    yield _sse(content)
+                    continue
+                if not buffer:
+                    buffered_at = time.perf_counter()
+                buffer.append(content)
+                buffered += len(content)
+                if buffered >= STREAM_FLUSH_CHARS or STREAM_FLUSH_MS <= 0:
+                    frames += 1
+                    yield _sse("".join(buffer))
+                    buffer, buffered = [], 0
+
+            if buffer:
+                frames += 1
+                yield _sse("".join(buffer))
+            outcome = "ok"
+            frames += 1
+            yield _sse(json.dumps({
+                "tokens": tokens,
+                "frames": frames,
+                "ttft_ms": round((first_token - start) * 1000, 1) if first_token else None,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "usage": usage,
+            }), event="end")
+        except Exception as e:
+            # Headers are already sent, so the error goes out as an event
+            outcome = "error"
+            print(f"Error streaming chat for thread {request.thread_id}: {e}")
+            frames += 1
+            yield _sse(json.dumps({"detail": str(e)}), event="error")
+        finally:
+            # Also reached when the client goes away mid-stream
+            pump.cancel()
+            CHAT_REQUESTS.inc(outcome=outcome)
+            CHAT_TOKENS.inc(tokens)
+            CHAT_FRAMES.inc(frames)
+            CHAT_SECONDS.observe(time.perf_counter() - start)
+
+    return StreamingResponse(
+        event_generator(), 
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+# Items are scheduled in windows so each window's query embeddings go out
+# as one request and are still in the query LRU when the items run.
+BATCH_WINDOW = 256
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest):
+    """
+    Answers many independent questions (no shared history) and streams one
+    NDJSON line per item as it finishes, then a summary line.
+    """
+    _require_collection(request.collection_id, request.use_rag)
+    semaphore = asyncio.Semaphore(request.concurrency)
+    memo = {}
+
+    async def run_item(index: int, item: BatchChatItem):
+        async with semaphore:
+            retrieval_memo.set(memo)
+            thread_id = f"batch-{uuid4().hex}"
+            inputs = {
+                "query": item.query,
+                "RAG": request.use_rag,
+                "web_search": request.use_web,
+                "model_name": request.model_name,
+                "collection_id": request.collection_id,
+                "context": [],
+                "metadata": [],
+                "web_context": "",
+            }
+            start = time.perf_counter()
+            answer, error = None, None
+            try:
+                result = await rag_app.ainvoke(inputs, config={"configurable": {"thread_id": thread_id}})
+                answer = result["response"][-1].content
+            except Exception as e:
+                error = str(e)
+            finally:
+                # One-off threads; don't leave them in the checkpointer
+                await rag_app.checkpointer.adelete_thread(thread_id)
+            return {
+                "index": index,
+                "id": item.id,
+                "query": item.query,
+                "answer": answer,
+                "error": error,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            }
+
+    async def results():
+        start = time.perf_counter()
+        failed = 0
+        items = request.items
+        for first in range(0, len(items), BATCH_WINDOW):
+            window = items[first:first + BATCH_WINDOW]
+            if request.use_rag:
+                try:
+                    await embeddings.awarm([item.query for item in window])
+                except Exception as e:
+                    # Items fall back to embedding their own query
+                    print(f"Batch embedding failed: {e}")
+            tasks = [asyncio.create_task(run_item(first + i, item)) for i, item in enumerate(window)]
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    line = await finished
+                    failed += line["error"] is not None
+                    yield json.dumps(line) + "\n"
+            finally:
+                # Client went away: don't keep answering for nobody
+                for task in tasks:
+                    task.cancel()
+
+        yield json.dumps({"summary": {
+            "items": len(items),
+            "failed": failed,
+            "unique_retrievals": len(memo),
+            "total_ms": round((time.perf_counter() - start) * 1000, 1),
+        }}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+# ---------------- STT ---------------- #
+@app.post("/stt")
+async def transcribe_audio(file: UploadFile = File(...)):
+    try:
+        return await STT(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ---------------- TTS ---------------- #
+@app.post("/tts")
+async def text_to_speech(req: TTSRequest):
+    try:
+        if req.stream:
+            return await _stream_speech(req)
+        audio_path = await TTS(req.text, req.voice)
+        return FileResponse(audio_path, media_type="audio/mpeg", filename="output.mp3")
+
+    except HTTPException:
+        raise
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Text-to-speech produced no audio in time")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _stream_speech(req: TTSRequest):
+    chunks = stream_TTS(req.text, req.voice)
+    # The first chunk is awaited before responding, so a failure can still
+    # be reported with a status code
+    try:
+        first = await anext(chunks)
+    except StopAsyncIteration:
+        raise HTTPException(status_code=500, detail="Text-to-speech produced no audio")
+
+    async def body():
+        try:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(body(), media_type="audio/mpeg")
@@ -0,0 +1,98 @@
+"""
+Minimal in-process ASGI client: drives the FastAPI app directly, without
+a socket or uvicorn, and records when each body chunk arrives.
+"""
+import json
+import time
+import asyncio
+from uuid import uuid4
+
+
+class StreamResult:
+    def __init__(self, status: int, chunks: list, started: float, first_chunk: float, finished: float,
+                 arrivals: list = None):
+        self.status = status
+        self.chunks = chunks
+        self.ttfb = (first_chunk - started) if first_chunk else None
+        self.total = finished - started
+        # Seconds from the request to each chunk in `chunks`
+        self.offsets = [t - started for t in arrivals or []]
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+def multipart(fields: dict = None, files: dict = None) -> tuple[bytes, str]:
+    """
+    multipart/form-data body and content type for `fields` (name -> str)
+    and `files` (name -> (filename, bytes, content type)).
+    """
+    boundary = uuid4().hex
+    parts = []
+    for name, value in (fields or {}).items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode()
+            + str(value).encode("utf-8") + b"\r\n"
+        )
+    for name, (filename, data, content_type) in (files or {}).items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n".encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+async def request(app, method: str, path: str, json_body=None, body: bytes = None,
+                  content_type: str = "application/json") -> StreamResult:
+    """Sends json_body as JSON, or a raw body (see multipart) with content_type."""
+    if body is None:
+        body = json.dumps(json_body).encode("utf-8") if json_body is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+    request_sent = False
+    status = None
+    chunks = []
+    arrivals = []
+    first_chunk = None
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The client never disconnects; the app cancels this wait when done
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status, first_chunk
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            now = time.perf_counter()
+            if first_chunk is None:
+                first_chunk = now
+            chunks.append(message["body"])
+            arrivals.append(now)
+
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    return StreamResult(status, chunks, started, first_chunk, time.perf_counter(), arrivals)
@@ -0,0 +1,138 @@
+"""
+Load test for /chat: N concurrent SSE streams against the FastAPI app on
+a single event loop (what one uvicorn worker runs), with the LLM,
+embeddings and web search replaced by the async fakes in
+benchmarks/fakes.py.
+
+If the graph is async end to end, wall time stays close to one stream's
+latency as concurrency grows, and no work lands on the default thread
+pool (whose 40-ish threads would otherwise cap concurrency).
+
+    python -m benchmarks.bench_chat_concurrency --levels 1,10,50,200
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Placeholder keys: the real clients are built on first use, and the fakes
+# below replace them before that
+for key in ("OPENAI_API_KEY", "GROQ_API_KEY", "TAVILY_API_KEY"):
+    os.environ.setdefault(key, "benchmark")
+
+import RAG
+import app as server
+from faiss_index import make_store
+from benchmarks.asgi import request
+from benchmarks.fakes import FakeStreamingChatModel, HashEmbeddings, StubSearch
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """Default executor that counts how much work is pushed onto threads."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+def install_fakes(args):
+    embedder = HashEmbeddings(latency=args.embed_latency)
+    RAG.embeddings.underlying = embedder
+
+    texts = [f"Passage {i} of the benchmark corpus about topic {i % 17}." for i in range(500)]
+    store = make_store(texts, embedder.embed_documents(texts), [{"page": i} for i in range(len(texts))], RAG.embeddings)
+    # Fill the default holder first so the warm-up can't swap this one out
+    RAG.collection_indexes.get(RAG.DEFAULT_COLLECTION)
+    RAG.vector_store.swap(store, [])
+
+    model = FakeStreamingChatModel(ttft=args.ttft, token_delay=args.token_delay)
+    # Behind the real router, so routing overhead is part of the measurement
+    RAG.model_router.models = {name: model for name in RAG.MODELS}
+    RAG.set_search_backend(StubSearch(latency=args.search_latency))
+
+
+async def one_stream(i: int, round_id: int):
+    result = await request(server.app, "POST", "/chat", {
+        "query": f"Question {i} in round {round_id}",
+        "thread_id": f"bench-{round_id}-{i}",
+        "use_rag": True,
+        "use_web": True,
+    })
+    assert result.status == 200, result.status
+    assert b"data:" in result.body
+    return result
+
+
+async def run_level(concurrency: int, round_id: int) -> dict:
+    peak_threads = threading.active_count()
+    done = asyncio.Event()
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.005)
+
+    sampler = asyncio.create_task(sample_threads())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one_stream(i, round_id) for i in range(concurrency)))
+    wall = time.perf_counter() - start
+    done.set()
+    await sampler
+
+    ttfb = sorted(r.ttfb for r in results)
+    totals = sorted(r.total for r in results)
+    return {
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "streams_per_s": round(concurrency / wall, 1),
+        "ttfb_p50_ms": round(ttfb[len(ttfb) // 2] * 1000, 1),
+        "ttfb_max_ms": round(ttfb[-1] * 1000, 1),
+        "stream_p50_ms": round(totals[len(totals) // 2] * 1000, 1),
+        "stream_max_ms": round(totals[-1] * 1000, 1),
+        "peak_threads": peak_threads,
+    }
+
+
+async def run(args):
+    install_fakes(args)
+    executor = CountingExecutor(max_workers=args.pool_size)
+    asyncio.get_running_loop().set_default_executor(executor)
+
+    rows = []
+    async with RAG.use_checkpointer():
+        for round_id, level in enumerate(int(n) for n in args.levels.split(",")):
+            rows.append(await run_level(level, round_id))
+
+    print(json.dumps({
+        "fake_ttft_s": args.ttft,
+        "fake_token_delay_s": args.token_delay,
+        "fake_embed_latency_s": args.embed_latency,
+        "fake_search_latency_s": args.search_latency,
+        "default_pool_size": args.pool_size,
+        "default_pool_submissions": executor.submitted,
+        "levels": rows,
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", default="1,10,50,200")
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    # A deliberately small pool: a sync node would serialize on it
+    parser.add_argument("--pool-size", type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Process RSS while N synthetic chat threads each run one turn through a
+small message graph, with the in-process MemorySaver versus the evicting
+SQLite checkpointer. Each saver runs in its own subprocess so their heaps
+don't mix.
+
+    python -m benchmarks.bench_checkpointer --threads 100000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import subprocess
+import tempfile
+from typing import TypedDict, Annotated
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
+from checkpointer import open_checkpointer
+
+ANSWER = ("Here is a typical answer of a few sentences, long enough to look like a real reply "
+          "from the assistant and to make each checkpoint carry some weight. ") * 4
+
+
+class State(TypedDict):
+    query: str
+    response: Annotated[list[BaseMessage], add_messages]
+
+
+async def answer(state: State):
+    return {"response": [HumanMessage(content=state["query"]), AIMessage(content=ANSWER)]}
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is the peak, in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+async def run_saver(args) -> dict:
+    db_path = os.path.join(args.workdir, "checkpoints.sqlite")
+    async with open_checkpointer(args.saver, db_path) as saver:
+        if args.saver == "sqlite":
+            saver.max_threads = args.max_threads
+
+        graph = StateGraph(State)
+        graph.add_node("answer", answer)
+        graph.add_edge(START, "answer")
+        graph.add_edge("answer", END)
+        app = graph.compile(checkpointer=saver)
+
+        samples = [(0, round(rss_mb(), 1))]
+        step = max(1, args.threads // 10)
+        start = time.perf_counter()
+        for first in range(0, args.threads, args.batch):
+            batch = range(first, min(first + args.batch, args.threads))
+            await asyncio.gather(*(
+                app.ainvoke({"query": f"Question from user {i}"}, {"configurable": {"thread_id": f"user-{i}"}})
+                for i in batch
+            ))
+            if batch.stop % step == 0 or batch.stop == args.threads:
+                samples.append((batch.stop, round(rss_mb(), 1)))
+        elapsed = time.perf_counter() - start
+
+        result = {
+            "saver": args.saver,
+            "threads": args.threads,
+            "turns_per_s": round(args.threads / elapsed, 1),
+            "rss_start_mb": samples[0][1],
+            "rss_end_mb": samples[-1][1],
+            "rss_growth_mb": round(samples[-1][1] - samples[0][1], 1),
+            "rss_samples": samples,
+        }
+        if args.saver == "sqlite":
+            result["checkpointer"] = await saver.astats()
+            result["db_size_mb"] = round(os.path.getsize(db_path) / 2 ** 20, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=100_000)
+    parser.add_argument("--max-threads", type=int, default=10_000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--saver", choices=["memory", "sqlite"], help="run a single saver in this process")
+    parser.add_argument("--workdir")
+    args = parser.parse_args()
+
+    if args.saver:
+        print(json.dumps(asyncio.run(run_saver(args))))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for saver in ("memory", "sqlite"):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_checkpointer", "--saver", saver,
+                 "--threads", str(args.threads), "--max-threads", str(args.max_threads),
+                 "--batch", str(args.batch), "--workdir", workdir],
+                check=True, capture_output=True, text=True,
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
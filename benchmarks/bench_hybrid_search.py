@@ -0,0 +1,131 @@
+"""
+Per-query cost of hybrid retrieval: BM25 build time and size, BM25
+search latency, and faiss_search end to end with and without the keyword
+side, on a synthetic corpus of manual-like chunks with part numbers and
+error codes.
+
+The embedding call is simulated with --embed-latency; BM25 runs while it
+is in flight, so the added wall time should be close to zero unless
+BM25 itself takes longer than the embedding round trip.
+
+    python -m benchmarks.bench_hybrid_search --chunks 50000
+"""
+import os
+import json
+import time
+import pickle
+import random
+import asyncio
+import argparse
+import numpy as np
+
+# Placeholder keys: the real clients are built on first use, and the fakes
+# below replace them before that
+for key in ("OPENAI_API_KEY", "GROQ_API_KEY", "TAVILY_API_KEY"):
+    os.environ.setdefault(key, "benchmark")
+os.environ.setdefault("CHECKPOINTER", "memory")
+
+import RAG
+from bm25 import BM25Index
+from faiss_index import make_store
+from benchmarks.fakes import HashEmbeddings
+
+WORDS = ("pump valve torque seal bearing pressure flow sensor motor housing gasket filter "
+         "inlet outlet shaft coupling alarm reset calibrate inspect replace tighten loosen "
+         "clockwise maintenance interval warning caution temperature voltage").split()
+
+
+def synthetic_corpus(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    texts, codes = [], []
+    for i in range(n):
+        code = f"E-{rng.randint(1000, 9999)}"
+        part = f"PN-{rng.randint(10000, 99999)}.{rng.randint(1, 9)}"
+        words = [rng.choice(WORDS) for _ in range(150)]
+        words.insert(rng.randrange(len(words)), f"error {code}")
+        words.insert(rng.randrange(len(words)), f"part {part}")
+        texts.append(" ".join(words))
+        codes.append((code, part))
+    return texts, codes
+
+
+def percentile(values, p):
+    return round(float(np.percentile(values, p)) * 1000, 3)
+
+
+async def time_search(queries, repeats: int = 1):
+    latencies = []
+    for _ in range(repeats):
+        for query in queries:
+            # Defeat the query-embedding LRU so every call pays the latency
+            RAG.embeddings._lru.clear()
+            start = time.perf_counter()
+            await RAG.faiss_search.ainvoke({"query": query})
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run(args):
+    texts, codes = synthetic_corpus(args.chunks)
+    embedder = HashEmbeddings(size=args.dim, latency=args.embed_latency)
+    RAG.embeddings.underlying = embedder
+
+    store = make_store(texts, embedder.embed_documents(texts), [{"page": i} for i in range(len(texts))], RAG.embeddings)
+
+    start = time.perf_counter()
+    keyword_index = BM25Index.from_store(store)
+    build_s = time.perf_counter() - start
+    size_mb = len(pickle.dumps((keyword_index.ids, keyword_index.lengths, keyword_index.postings))) / 2 ** 20
+    store.keyword_index = keyword_index
+    # Fill the default holder first so the warm-up can't swap this one out
+    RAG.collection_indexes.get(RAG.DEFAULT_COLLECTION)
+    RAG.vector_store.swap(store, [])
+
+    rng = random.Random(1)
+    sample = [codes[rng.randrange(len(codes))] for _ in range(args.queries)]
+    queries = [f"What does error {code} mean for part {part}?" for code, part in sample]
+
+    bm25_latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        keyword_index.search(query, RAG.RETRIEVAL_K)
+        bm25_latencies.append(time.perf_counter() - start)
+
+    RAG.HYBRID_SEARCH = False
+    vector_only = await time_search(queries)
+    RAG.HYBRID_SEARCH = True
+    hybrid = await time_search(queries)
+
+    # How often the chunk holding the exact error code comes back first
+    exact = 0
+    for (code, _), query in zip(sample, queries):
+        hits = keyword_index.search(query, 1)
+        exact += bool(hits) and code in store.docstore.search(hits[0][0]).page_content
+
+    print(json.dumps({
+        "chunks": args.chunks,
+        "embed_latency_ms": args.embed_latency * 1000,
+        "bm25_build_s": round(build_s, 2),
+        "bm25_size_mb": round(size_mb, 1),
+        "bm25_terms": len(keyword_index.postings),
+        "bm25_search_p50_ms": percentile(bm25_latencies, 50),
+        "bm25_search_p99_ms": percentile(bm25_latencies, 99),
+        "search_vector_only_p50_ms": percentile(vector_only, 50),
+        "search_hybrid_p50_ms": percentile(hybrid, 50),
+        "search_vector_only_p99_ms": percentile(vector_only, 99),
+        "search_hybrid_p99_ms": percentile(hybrid, 99),
+        "bm25_top1_exact_code_rate": round(exact / len(queries), 3),
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--embed-latency", type=float, default=0.03)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Time to first token and success rate through the model router, against
+fake providers with a slow tail and random errors: the primary model
+alone, routed with failover only, and routed with hedged requests.
+
+    python -m benchmarks.bench_model_routing --requests 500 --slow-rate 0.05
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import numpy as np
+from langchain_core.messages import HumanMessage
+from model_routing import ModelRouter, RoutedChatModel
+from benchmarks.fakes import FakeStreamingChatModel
+
+
+def percentile(values, p):
+    return round(float(np.percentile(values, p)) * 1000, 1) if values else None
+
+
+def make_models(args) -> dict:
+    common = dict(token_delay=0.0, slow_rate=args.slow_rate, slow_ttft=args.slow_ttft)
+    return {
+        "primary": FakeStreamingChatModel(ttft=args.ttft, error_rate=args.error_rate, **common),
+        "fallback": FakeStreamingChatModel(ttft=args.ttft * 1.5, **common),
+    }
+
+
+async def measure(model, args) -> dict:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    ttfts, failures = [], 0
+
+    async def one(i: int):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async for _ in model.astream([HumanMessage(content=f"Question {i}")]):
+                    ttfts.append(time.perf_counter() - start)
+                    break
+            except Exception:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    return {
+        "ttft_p50_ms": percentile(ttfts, 50),
+        "ttft_p95_ms": percentile(ttfts, 95),
+        "ttft_p99_ms": percentile(ttfts, 99),
+        "success_rate": round(1 - failures / args.requests, 3),
+        "wall_s": round(time.perf_counter() - start, 2),
+    }
+
+
+async def run(args):
+    results = {}
+
+    random.seed(args.seed)
+    results["primary_only"] = await measure(make_models(args)["primary"], args)
+
+    for label, hedge_delay in (("failover_only", "off"), ("hedged", args.hedge_delay)):
+        random.seed(args.seed)
+        router = ModelRouter(make_models(args), {"primary": ["fallback"]}, hedge_delay=hedge_delay)
+        results[label] = await measure(RoutedChatModel(router=router, model_name="primary"), args)
+        sent = sum(stats.requests for stats in router.stats.values())
+        results[label]["extra_requests_pct"] = round(100 * (sent - args.requests) / args.requests, 1)
+        results[label]["router"] = router.summary()
+
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--ttft", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ttft", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--hedge-delay", default="auto")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
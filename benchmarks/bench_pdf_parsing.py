@@ -0,0 +1,54 @@
+"""
+Serial vs multi-process PDF text extraction.
+
+    python -m benchmarks.bench_pdf_parsing --pages 400 --workers 4
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+from langchain_community.document_loaders import PyPDFLoader
+from pdf_parsing import PARSE_WORKERS, iter_pages_parallel
+from benchmarks.synthetic_pdf import make_pdf
+
+
+def _run(label, pages_iter):
+    start = time.perf_counter()
+    pages = list(pages_iter)
+    elapsed = time.perf_counter() - start
+    return pages, {
+        "path": label,
+        "pages": len(pages),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(len(pages) / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_pdf(os.path.join(tmp, "bench.pdf"), args.pages)
+
+        serial_pages, serial = _run("serial", PyPDFLoader(pdf_path).lazy_load())
+        parallel_pages, parallel = _run(
+            f"parallel x{args.workers}", iter_pages_parallel(pdf_path, args.workers)
+        )
+
+    # The parallel path must be a drop-in replacement for the serial one
+    assert [p.metadata["page"] for p in parallel_pages] == list(range(args.pages))
+    for s, p in zip(serial_pages, parallel_pages):
+        assert s.page_content == p.page_content
+        assert (s.metadata["source"], s.metadata["page"]) == (p.metadata["source"], p.metadata["page"])
+
+    results = [serial, parallel]
+    results.append({"speedup": round(parallel["pages_per_sec"] / serial["pages_per_sec"], 2)})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
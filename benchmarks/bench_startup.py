@@ -0,0 +1,128 @@
+"""
+Cold-start cost of the chat server, each run in a fresh interpreter:
+time to import app, time until "/" answers, time until "/ready" turns
+200, and the latency of the first and second /chat requests.
+
+The model and embedding clients are local fakes, but their factories
+still import the real provider SDKs, so the deferred import cost shows
+up where the server would pay it. The default index is a synthetic one
+of --chunks chunks saved to a temporary directory.
+
+    python -m benchmarks.bench_startup --chunks 20000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import tempfile
+from contextlib import AsyncExitStack
+
+START = time.perf_counter()
+
+for key in ("OPENAI_API_KEY", "GROQ_API_KEY", "TAVILY_API_KEY"):
+    os.environ.setdefault(key, "benchmark")
+os.environ.setdefault("CHECKPOINTER", "memory")
+
+
+def build_index(path: str, chunks: int, dim: int):
+    from bm25 import BM25Index
+    from faiss_index import make_store, save_store
+    from benchmarks.fakes import HashEmbeddings
+
+    embedder = HashEmbeddings(size=dim)
+    texts = [f"Passage {i} of the benchmark corpus about topic {i % 17}." for i in range(chunks)]
+    store = make_store(texts, embedder.embed_documents(texts), [{"page": i} for i in range(chunks)], embedder)
+    BM25Index.from_store(store).save(path)
+    save_store(store, path)
+
+
+def install_fakes(RAG, dim: int):
+    from benchmarks.fakes import FakeStreamingChatModel, HashEmbeddings, StubSearch
+
+    def embeddings():
+        import langchain_openai  # noqa: F401 - the cost the real factory pays
+        return HashEmbeddings(size=dim)
+
+    def model():
+        import langchain_openai, langchain_groq  # noqa: F401, E401
+        return FakeStreamingChatModel(ttft=0.05, token_delay=0.001)
+
+    RAG.embeddings._factory = embeddings
+    RAG.model_router.models = {name: model for name in RAG.MODELS}
+    RAG.set_search_backend(StubSearch(latency=0.0))
+
+
+async def child(args) -> dict:
+    import_start = time.perf_counter()
+    import RAG
+    import app as server
+    from benchmarks.asgi import request
+    result = {"mode": args.mode, "import_app_s": round(time.perf_counter() - import_start, 3)}
+
+    RAG.FAISS_DB_PATH = args.index
+    install_fakes(RAG, args.dim)
+
+    async with AsyncExitStack() as stack:
+        if args.mode == "background":
+            # What the server does: warm up behind the lifespan handler
+            await stack.enter_async_context(server.lifespan(server.app))
+            health = await request(server.app, "GET", "/")
+            result["health_ok_s"] = round(time.perf_counter() - START, 3)
+            assert health.status == 200
+            while (await request(server.app, "GET", "/ready")).status != 200:
+                await asyncio.sleep(0.01)
+            result["ready_s"] = round(time.perf_counter() - START, 3)
+
+        chat = {"query": "What is topic 3 about?", "use_rag": True, "use_web": False}
+        for label in ("first_chat_ms", "second_chat_ms"):
+            response = await request(server.app, "POST", "/chat", {**chat, "thread_id": label})
+            assert response.status == 200, response.status
+            result[label] = round(response.total * 1000, 1)
+        result["process_s"] = round(time.perf_counter() - START, 3)
+
+        if server.warm_up_task is not None:
+            await server.warm_up_task
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--mode", choices=["cold", "background"], help="run one measurement in this process")
+    parser.add_argument("--index")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(child(args))))
+        return
+
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        index = os.path.join(workdir, "db_faiss")
+        build_index(index, args.chunks, args.dim)
+        for _ in range(args.repeats):
+            # cold: the first request loads the index and builds the clients;
+            # background: the startup warm-up does, before /ready turns 200
+            for mode in ("cold", "background"):
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_startup", "--mode", mode,
+                     "--index", index, "--dim", str(args.dim)],
+                    check=True, capture_output=True, text=True,
+                )
+                runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    summary = {}
+    for mode in ("cold", "background"):
+        mode_runs = [run for run in runs if run["mode"] == mode]
+        keys = [key for key in mode_runs[0] if key != "mode"]
+        summary[mode] = {key: round(sorted(run[key] for run in mode_runs)[len(mode_runs) // 2], 3) for key in keys}
+    print(json.dumps({"chunks": args.chunks, "median": summary, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
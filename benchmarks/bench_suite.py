@@ -0,0 +1,325 @@
+"""
+Offline throughput suite for the chat server: rag_app.ainvoke, Ingest_Data,
+/chat, /stt and /tts (whole file, and streamed), each driven at every --concurrency level with
+--requests requests (closed loop: that many in flight at once).
+
+OpenAI, Groq, Tavily and Edge TTS are replaced by the deterministic fakes
+in benchmarks/fakes.py, with fixed latencies set by the flags below, and
+everything runs in a temporary working directory, so a run needs no
+network, API keys or existing index. Per scenario and level it reports
+p50/p99 latency, requests/sec and, for streams, time to first token
+(/chat) or first byte (/tts). The JSON also records the commit, Python
+and platform, so runs saved with --output can be compared across
+commits with --compare.
+
+    python -m benchmarks.bench_suite --concurrency 1,10,50 --output before.json
+    python -m benchmarks.bench_suite --concurrency 1,10,50 --compare before.json
+
+The translator server is not covered: it runs a local NLLB model.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+for key in ("OPENAI_API_KEY", "GROQ_API_KEY", "TAVILY_API_KEY"):
+    os.environ.setdefault(key, "benchmark")
+os.environ.setdefault("CHECKPOINTER", "memory")
+
+SCENARIOS = ("graph", "chat", "ingest", "stt", "tts", "tts_stream")
+# What the first-chunk time means for streamed responses, and what
+# per-second rate each scenario reports besides requests
+FIRST = {"chat": "ttft", "tts": "ttfb", "tts_stream": "ttfb"}
+UNITS = {"chat": "tokens", "ingest": "chunks", "tts": "audio_bytes", "tts_stream": "audio_bytes"}
+COMPARED = ("p50_ms", "p99_ms", "rps", "ttft_p50_ms", "ttft_p99_ms", "ttfb_p50_ms", "ttfb_p99_ms")
+
+
+def percentile(values, p):
+    return round(float(np.percentile(values, p)) * 1000, 1) if values else None
+
+
+def environment() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+#===========================================
+# Fakes
+#===========================================
+
+def install_fakes(args, RAG, utils, data_ingestion):
+    from faiss_index import make_store
+    from embedding_cache import CachedEmbeddings
+    from benchmarks.fakes import FakeStreamingChatModel, HashEmbeddings, StubSearch, StubTranscriber, StubSpeech
+
+    embedder = HashEmbeddings(latency=args.embed_latency)
+    RAG.embeddings.underlying = embedder
+
+    texts = [f"Passage {i} of the benchmark corpus about topic {i % 17}." for i in range(args.corpus)]
+    store = make_store(texts, embedder.embed_documents(texts), [{"page": i} for i in range(len(texts))], RAG.embeddings)
+    # Fill the default holder first so the warm-up can't swap this one out
+    RAG.collection_indexes.get(RAG.DEFAULT_COLLECTION)
+    RAG.vector_store.swap(store, [])
+
+    model = FakeStreamingChatModel(ttft=args.ttft, token_delay=args.token_delay)
+    RAG.model_router.models = {name: model for name in RAG.MODELS}
+    RAG.set_search_backend(StubSearch(latency=args.search_latency))
+
+    # Ingestion keeps its on-disk embedding cache (in the work directory)
+    data_ingestion.cached_embeddings = CachedEmbeddings(embedder, data_ingestion.embedding_cache, "benchmark")
+    utils.set_stt_client(StubTranscriber(latency=args.stt_latency))
+    utils.set_tts_backend(StubSpeech(latency=args.tts_latency))
+
+
+#===========================================
+# Scenarios
+#===========================================
+
+def make_scenarios(args, RAG, server, data_ingestion) -> dict:
+    """name -> (prepare(n, tag) or None, one(i, tag) -> {"first", "units"})."""
+    from benchmarks.asgi import request, multipart
+    from benchmarks.fakes import make_wav
+    from benchmarks.synthetic_pdf import make_pdf
+
+    def chat_request(i: int, tag: str) -> dict:
+        return {"query": f"Question {i} in round {tag}", "thread_id": f"{tag}-{i}", "use_rag": True, "use_web": True}
+
+    async def graph(i: int, tag: str) -> dict:
+        body = chat_request(i, tag)
+        inputs = {
+            "query": body["query"], "RAG": True, "web_search": True, "model_name": RAG.DEFAULT_MODEL,
+            "collection_id": RAG.DEFAULT_COLLECTION, "context": [], "metadata": [], "web_context": "",
+        }
+        await RAG.app.ainvoke(inputs, config={"configurable": {"thread_id": body["thread_id"]}})
+        return {}
+
+    async def chat(i: int, tag: str) -> dict:
+        result = await request(server.app, "POST", "/chat", chat_request(i, tag))
+        assert result.status == 200, result.status
+        body = result.body.decode("utf-8")
+        assert "event: end" in body, body[-200:]
+        # Token frames come first; the end event reports how many tokens they held
+        end = json.loads(body.rsplit("data: ", 1)[1])
+        return {"first": result.offsets[0], "units": end["tokens"]}
+
+    def ingest_pdf(i: int, tag: str) -> str:
+        return os.path.join("bench_pdfs", f"{tag}-{i}.pdf")
+
+    def prepare_ingest(n: int, tag: str):
+        os.makedirs("bench_pdfs", exist_ok=True)
+        for i in range(n):
+            # Distinct text per file, so each one pays for its embeddings
+            make_pdf(ingest_pdf(i, tag), args.ingest_pages, tag=f"{tag}-{i} ")
+
+    async def ingest(i: int, tag: str) -> dict:
+        result = await asyncio.to_thread(
+            data_ingestion.Ingest_Data, ingest_pdf(i, tag),
+            vector_db_path=os.path.join("bench_indexes", f"{tag}-{i}"), incremental=False,
+        )
+        assert result["status"] == "success", result.get("message")
+        return {"units": result["chunks_processed"]}
+
+    audio = make_wav(args.audio_seconds)
+    speech_text = "Here is the answer read back to you. " * 8
+
+    async def stt(i: int, tag: str) -> dict:
+        body, content_type = multipart(files={"file": (f"{tag}-{i}.wav", audio, "audio/wav")})
+        result = await request(server.app, "POST", "/stt", body=body, content_type=content_type)
+        assert result.status == 200, result.status
+        assert json.loads(result.body)["text"]
+        return {}
+
+    async def tts(i: int, tag: str, stream: bool = False) -> dict:
+        # Distinct text per request, so every one is synthesized
+        result = await request(server.app, "POST", "/tts", {"text": f"{speech_text}({tag}-{i})", "stream": stream})
+        assert result.status == 200, result.status
+        return {"first": result.ttfb, "units": len(result.body)}
+
+    async def tts_stream(i: int, tag: str) -> dict:
+        return await tts(i, tag, stream=True)
+
+    return {
+        "graph": (None, graph),
+        "chat": (None, chat),
+        "ingest": (prepare_ingest, ingest),
+        "stt": (None, stt),
+        "tts": (None, tts),
+        "tts_stream": (None, tts_stream),
+    }
+
+
+#===========================================
+# Driver
+#===========================================
+
+async def drive(name: str, one, requests: int, concurrency: int, tag: str) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, firsts, units, errors = [], [], 0, []
+
+    async def worker(i: int):
+        nonlocal units
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                out = await one(i, tag)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+            latencies.append(time.perf_counter() - start)
+            if out.get("first") is not None:
+                firsts.append(out["first"])
+            units += out.get("units", 0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+
+    row = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "wall_s": round(wall, 3),
+        "rps": round(len(latencies) / wall, 2),
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+    }
+    if name in FIRST:
+        row[f"{FIRST[name]}_p50_ms"] = percentile(firsts, 50)
+        row[f"{FIRST[name]}_p99_ms"] = percentile(firsts, 99)
+    if name in UNITS:
+        row[f"{UNITS[name]}_per_s"] = round(units / wall, 1)
+    if errors:
+        row["first_error"] = errors[0]
+    return row
+
+
+def compare(baseline: dict, results: dict) -> dict:
+    """Change in percent of the COMPARED metrics for every scenario and level in both runs."""
+    out = {}
+    for name, rows in results.items():
+        base_rows = {row["concurrency"]: row for row in baseline.get("results", {}).get(name, [])}
+        for row in rows:
+            base = base_rows.get(row["concurrency"])
+            if base is None:
+                continue
+            deltas = {}
+            for key in COMPARED:
+                if base.get(key) and row.get(key) is not None:
+                    deltas[key] = {"base": base[key], "now": row[key],
+                                   "change_pct": round(100 * (row[key] - base[key]) / base[key], 1)}
+            out.setdefault(name, {})[str(row["concurrency"])] = deltas
+    return out
+
+
+async def run(args) -> dict:
+    import RAG
+    import utils
+    import data_ingestion
+    import app as server
+
+    install_fakes(args, RAG, utils, data_ingestion)
+    results = {}
+    # What the server does on startup, finished before anything is timed
+    async with server.lifespan(server.app):
+        await server.warm_up_task
+
+        scenarios = make_scenarios(args, RAG, server, data_ingestion)
+        for name in args.scenarios.split(","):
+            prepare, one = scenarios[name]
+            requests = args.ingest_requests if name == "ingest" else args.requests
+            results[name] = []
+            for level in (int(n) for n in args.concurrency.split(",")):
+                tag = f"{name}-c{level}"
+                random.seed(args.seed)
+                if prepare is not None:
+                    prepare(requests + args.warmup, tag)
+                # Untimed: first-use costs (lazy imports, first sqlite writes)
+                for i in range(args.warmup):
+                    await one(requests + i, tag)
+                results[name].append(await drive(name, one, requests, level, tag))
+                print(f"{name} @ {level}: {results[name][-1]}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,10,50")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and level")
+    parser.add_argument("--ingest-requests", type=int, default=8)
+    parser.add_argument("--ingest-pages", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--corpus", type=int, default=500, help="chunks in the default index")
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--stt-latency", type=float, default=0.3)
+    parser.add_argument("--tts-latency", type=float, default=0.2)
+    parser.add_argument("--audio-seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--compare", help="JSON report of an earlier run to diff against")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = {"environment": environment(), "config": vars(args)}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            # Keeps stdout for the report: the server's own prints go to stderr
+            with contextlib.redirect_stdout(sys.stderr):
+                report["results"] = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        # Levels and scenarios are matched row by row; the rest must agree
+        keys = ("scenarios", "concurrency", "output", "compare")
+        report["compare"] = {
+            "baseline_commit": baseline.get("environment", {}).get("commit"),
+            "same_config": {k: v for k, v in baseline.get("config", {}).items() if k not in keys}
+                           == {k: v for k, v in report["config"].items() if k not in keys},
+            "results": compare(baseline, report["results"]),
+        }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
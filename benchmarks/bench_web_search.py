@@ -0,0 +1,49 @@
+"""
+Web search caching and request coalescing against the local stub backend.
+
+    python -m benchmarks.bench_web_search --concurrency 50 --latency 0.2
+"""
+import json
+import time
+import asyncio
+import argparse
+import RAG
+from benchmarks.fakes import StubSearch
+
+
+async def burst(query: str, concurrency: int) -> float:
+    start = time.perf_counter()
+    results = await asyncio.gather(*(RAG.tavily_search.ainvoke(query) for _ in range(concurrency)))
+    assert all("results" in r for r in results)
+    return time.perf_counter() - start
+
+
+async def run(args):
+    stub = StubSearch(latency=args.latency)
+    RAG.set_search_backend(stub)
+
+    cold = await burst("latest AI news", args.concurrency)
+    cold_calls = stub.calls
+    warm = await burst("Latest  AI news", args.concurrency)
+
+    print(json.dumps({
+        "concurrency": args.concurrency,
+        "stub_latency_s": args.latency,
+        "cold_burst_s": round(cold, 3),
+        "cold_upstream_calls": cold_calls,
+        "warm_burst_s": round(warm, 3),
+        "warm_upstream_calls": stub.calls - cold_calls,
+        "uncached_upstream_calls": 2 * args.concurrency,
+        "cache": RAG.get_cache_stats()["web_search"],
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
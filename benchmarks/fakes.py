@@ -0,0 +1,233 @@
+"""
+Deterministic local stand-ins for the external services, so benchmarks
+run without network access or API keys.
+"""
+import io
+import time
+import wave
+import random
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from typing import Any
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class StubSearch:
+    """
+    Drop-in for TavilySearchResults: same run / arun(query) interface, returns
+    fixed results derived from the query after a configurable delay.
+    """
+
+    def __init__(self, latency: float = 0.2, max_results: int = 2):
+        self.latency = latency
+        self.max_results = max_results
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _results(self, query: str):
+        digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:12]
+        return [
+            {
+                "url": f"https://example.com/{digest}/{i}",
+                "content": f"Stub result {i} for '{query.strip()[:80]}' ({digest})",
+            }
+            for i in range(self.max_results)
+        ]
+
+    def run(self, query: str):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return self._results(query)
+
+    async def arun(self, query: str):
+        with self._lock:
+            self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._results(query)
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic embeddings derived from sha256 of the text. Each call
+    waits `latency` seconds; the async methods do so without holding a
+    thread, like a network call would.
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+
+    def _vector(self, text: str) -> list[float]:
+        seed = hashlib.sha256(text.encode("utf-8")).digest()
+        values = []
+        while len(values) < self.size:
+            seed = hashlib.sha256(seed).digest()
+            values.extend(b / 127.5 - 1.0 for b in seed)
+        return values[:self.size]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await asyncio.sleep(self.latency)
+        return self._vector(text)
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    Chat model that streams a fixed reply word by word, waiting `ttft`
+    seconds before the first token and `token_delay` between tokens.
+
+    To stand in for a misbehaving provider, a `slow_rate` fraction of
+    requests wait `slow_ttft` instead, and an `error_rate` fraction fail
+    before the first token.
+    """
+
+    reply: str = "This is a canned answer from the benchmark chat model."
+    ttft: float = 0.1
+    token_delay: float = 0.01
+    slow_rate: float = 0.0
+    slow_ttft: float = 2.0
+    error_rate: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def _tokens(self):
+        words = self.reply.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def _first_token_delay(self) -> float:
+        if random.random() < self.error_rate:
+            raise ConnectionError(f"{self._llm_type}: simulated provider error")
+        return self.slow_ttft if random.random() < self.slow_rate else self.ttft
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._first_token_delay() + self.token_delay * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        await asyncio.sleep(self._first_token_delay())
+        for i, token in enumerate(self._tokens()):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def make_wav(seconds: float, rate: int = 16000, pause_every: float = 6.0, pause: float = 0.5) -> bytes:
+    """
+    Mono 16-bit WAV standing in for a recorded question: a tone with
+    `pause` seconds of silence every `pause_every` seconds, like the gaps
+    between sentences.
+    """
+    t = np.arange(int(seconds * rate)) / rate
+    samples = 3000 * np.sign(np.sin(2 * np.pi * 200 * t))
+    samples[t % pause_every >= pause_every - pause] = 0
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.astype("<i2").tobytes())
+    return out.getvalue()
+
+
+def _audio_seconds(data: bytes) -> float:
+    try:
+        with wave.open(io.BytesIO(data)) as w:
+            return w.getnframes() / w.getframerate()
+    except (wave.Error, EOFError):
+        # Not a WAV: assume 16 kHz 16-bit mono
+        return len(data) / 32000
+
+
+class StubTranscriber:
+    """
+    Drop-in for the AsyncGroq client used by utils.STT (see
+    utils.set_stt_client): answers audio.transcriptions.create(file=...)
+    with a transcript of one segment per call, after `latency` seconds
+    plus `seconds_per_audio_second` per second of audio.
+    """
+
+    def __init__(self, latency: float = 0.3, seconds_per_audio_second: float = 0.02):
+        self.latency = latency
+        self.seconds_per_audio_second = seconds_per_audio_second
+        self.calls = 0
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self.create))
+
+    async def create(self, file, model: str = None, response_format: str = None, temperature: float = None, **kwargs):
+        self.calls += 1
+        data = file.read() if hasattr(file, "read") else file[1]
+        duration = _audio_seconds(data)
+        await asyncio.sleep(self.latency + self.seconds_per_audio_second * duration)
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        text = f" Stub transcript of {duration:.1f} seconds of audio ({digest})."
+        segment = {"id": 0, "seek": 0, "start": 0.0, "end": round(duration, 2), "text": text}
+        return SimpleNamespace(text=text, segments=[segment], language="english")
+
+
+class StubSpeech:
+    """
+    Drop-in for edge_tts.Communicate (see utils.set_tts_backend): calling
+    it with (text, voice) returns a communicator whose stream() yields
+    deterministic "audio" chunks, the first after `latency` seconds and
+    the rest every `chunk_delay`, about `bytes_per_char` bytes per
+    character of text; save(path) writes them to a file.
+    """
+
+    def __init__(self, latency: float = 0.2, chunk_delay: float = 0.01,
+                 bytes_per_char: int = 200, chunk_size: int = 4096):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.bytes_per_char = bytes_per_char
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def __call__(self, text: str, voice: str = "en-US-AriaNeural"):
+        self.calls += 1
+        return _StubCommunicate(self, text, voice)
+
+
+class _StubCommunicate:
+    def __init__(self, speech: StubSpeech, text: str, voice: str):
+        self.speech = speech
+        self.text = text
+        self.voice = voice
+
+    def _audio(self) -> bytes:
+        seed = hashlib.sha256(f"{self.voice}\n{self.text}".encode("utf-8")).digest()
+        size = max(1, len(self.text)) * self.speech.bytes_per_char
+        return (seed * (size // len(seed) + 1))[:size]
+
+    async def stream(self):
+        audio = self._audio()
+        await asyncio.sleep(self.speech.latency)
+        for i in range(0, len(audio), self.speech.chunk_size):
+            if i:
+                await asyncio.sleep(self.speech.chunk_delay)
+            yield {"type": "audio", "data": audio[i:i + self.speech.chunk_size]}
+
+    async def save(self, path: str):
+        with open(path, "wb") as f:
+            async for chunk in self.stream():
+                f.write(chunk["data"])
@@ -0,0 +1,57 @@
+"""
+Writes text-only PDFs of arbitrary length without any extra dependency,
+so benchmarks can run on a clean box.
+"""
+
+WORDS = (
+    "pressure valve torque sensor calibration error E-1043 part PN-7781 "
+    "gasket housing firmware reset module voltage cable bracket assembly"
+).split()
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(path: str, pages: int, lines_per_page: int = 45, words_per_line: int = 12, tag: str = ""):
+    """`tag` is prefixed to every line, so PDFs with different tags share no chunk text."""
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    page_ids = []
+    for p in range(pages):
+        lines = []
+        for l in range(lines_per_page):
+            words = [WORDS[(p * 31 + l * 7 + w) % len(WORDS)] for w in range(words_per_line)]
+            text = _escape(f"{tag}{' '.join(words)} (page {p + 1}, line {l + 1})")
+            lines.append(f"BT /F1 9 Tf 36 {806 - l * 17} Td ({text}) Tj ET")
+        stream = "\n".join(lines).encode("latin-1")
+
+        page_id, content_id = 4 + 2 * p, 5 + 2 * p
+        page_ids.append(page_id)
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode()
+        objects[content_id] = f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream"
+
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[2] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += f"{obj_id} 0 obj\n".encode() + objects[obj_id] + b"\nendobj\n"
+
+    xref = len(out)
+    size = max(objects) + 1
+    out += f"xref\n0 {size}\n0000000000 65535 f \n".encode()
+    for obj_id in range(1, size):
+        out += f"{offsets[obj_id]:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
@@ -0,0 +1,160 @@
+import os
+import re
+import math
+import pickle
+import numpy as np
+
+
+#===========================================
+# Keyword index configuration
+#===========================================
+
+BM25_FILE = "bm25.pkl"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Identifiers such as "E-1234", "AB12.5" or "pump_v2" are kept whole, and
+# their parts are indexed as well, so "E1234" and "e-1234" both match.
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+_SEPARATORS = re.compile(r"[-_./:]")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            parts = _SEPARATORS.split(token)
+            tokens.append("".join(parts))
+            tokens.extend(part for part in parts if part not in _STOPWORDS)
+    return tokens
+
+
+#===========================================
+# Inverted index
+#===========================================
+
+class BM25Index:
+    """
+    In-process BM25 inverted index over a vector store's chunks.
+
+    Postings are numpy arrays of (document number, term frequency), and
+    documents are identified by their docstore id so hits can be fused
+    with FAISS results. Indexes are immutable once built; merged()
+    returns a new index, so a live one can be shared by searches while
+    the next one is assembled.
+    """
+
+    def __init__(self, ids: list[str], lengths: np.ndarray, postings: dict):
+        self.ids = ids
+        self.lengths = lengths
+        self.postings = postings          # term -> (doc numbers uint32, term frequencies uint16)
+        self.avg_length = float(lengths.mean()) if len(lengths) else 0.0
+
+    @classmethod
+    def build(cls, ids: list[str], texts: list[str]) -> "BM25Index":
+        lengths = np.zeros(len(texts), dtype=np.uint32)
+        counts = {}
+        for number, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[number] = len(tokens)
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, tf in frequencies.items():
+                docs, tfs = counts.setdefault(token, ([], []))
+                docs.append(number)
+                tfs.append(min(tf, 65535))
+
+        postings = {
+            token: (np.asarray(docs, dtype=np.uint32), np.asarray(tfs, dtype=np.uint16))
+            for token, (docs, tfs) in counts.items()
+        }
+        return cls(list(ids), lengths, postings)
+
+    @classmethod
+    def from_store(cls, store) -> "BM25Index":
+        """Indexes every chunk of a langchain FAISS store, in index order."""
+        ids = [store.index_to_docstore_id[i] for i in range(len(store.index_to_docstore_id))]
+        texts = [store.docstore.search(id_).page_content for id_ in ids]
+        return cls.build(ids, texts)
+
+    def merged(self, other: "BM25Index") -> "BM25Index":
+        offset = np.uint32(len(self.ids))
+        postings = dict(self.postings)
+        for token, (docs, tfs) in other.postings.items():
+            docs = docs + offset
+            if token in postings:
+                base_docs, base_tfs = postings[token]
+                postings[token] = (np.concatenate([base_docs, docs]), np.concatenate([base_tfs, tfs]))
+            else:
+                postings[token] = (docs, tfs)
+        return BM25Index(self.ids + other.ids, np.concatenate([self.lengths, other.lengths]), postings)
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """Returns up to k (docstore id, score) pairs, best first."""
+        if not self.ids:
+            return []
+        n = len(self.ids)
+        scores = np.zeros(n, dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            docs, tfs = posting
+            idf = math.log(1.0 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            tf = tfs.astype(np.float32)
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.lengths[docs] / self.avg_length)
+            scores[docs] += idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(self.ids[i], float(scores[i])) for i in hits]
+
+    def save(self, path: str):
+        # Written under a temporary name and renamed, so a reader never
+        # sees a half-written file
+        os.makedirs(path, exist_ok=True)
+        final_path = os.path.join(path, BM25_FILE)
+        temp_path = f"{final_path}.{os.getpid()}.{id(self)}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump((self.ids, self.lengths, self.postings), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, final_path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(os.path.join(path, BM25_FILE), "rb") as f:
+            return cls(*pickle.load(f))
+
+
+def load_or_build(path: str, store) -> BM25Index:
+    """Loads the keyword index saved next to a FAISS index, or builds it
+    from the store's chunks for indexes saved before it existed."""
+    if os.path.exists(os.path.join(path, BM25_FILE)):
+        return BM25Index.load(path)
+    return BM25Index.from_store(store)
+
+
+#===========================================
+# Rank fusion
+#===========================================
+
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(*rankings: list[str], k: int = RRF_K) -> list[str]:
+    """Fuses ranked id lists by summing 1 / (k + rank) per list."""
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
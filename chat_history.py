@@ -0,0 +1,69 @@
+import os
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+
+#===========================================
+# History budget
+#===========================================
+
+# Verbatim history past this many tokens is folded into the summary
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# ... or past this many turns, whatever their size
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "8"))
+# Turns left verbatim after older ones are folded into the summary
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "2"))
+
+
+def count_tokens(messages) -> int:
+    return count_tokens_approximately(messages) if messages else 0
+
+
+def split_turns(messages: list[BaseMessage]) -> list[list[BaseMessage]]:
+    """Groups a flat message list into turns, each starting at a HumanMessage."""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def needs_summary(turns: list) -> bool:
+    return len(turns) > HISTORY_MAX_TURNS or count_tokens(flatten(turns)) > HISTORY_TOKEN_BUDGET
+
+
+def flatten(turns: list) -> list[BaseMessage]:
+    return [message for turn in turns for message in turn]
+
+
+#===========================================
+# Summary prompts
+#===========================================
+
+SUMMARY_PROMPT = SystemMessage(
+    content="""
+You maintain a running summary of a conversation between a user and an assistant.
+Merge the new lines into the existing summary. Keep names, preferences, facts the user
+stated, decisions and open questions; drop pleasantries and anything already answered
+in full. Write plain prose, at most 200 words. Reply with the summary only.
+"""
+)
+
+
+def summary_request(summary: str, turns: list) -> list[BaseMessage]:
+    transcript = "\n".join(
+        f"{'User' if isinstance(message, HumanMessage) else 'Assistant'}: {message.content}"
+        for message in flatten(turns)
+    )
+    return [
+        SUMMARY_PROMPT,
+        HumanMessage(content=f"Existing summary:\n{summary or '(none)'}\n\nNew lines:\n{transcript}"),
+    ]
+
+
+def summary_message(summary: str):
+    """The system message that carries the summary into the chat prompt."""
+    if not summary:
+        return []
+    return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")]
@@ -0,0 +1,214 @@
+import os
+import time
+import zlib
+import aiosqlite
+from contextlib import asynccontextmanager
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+import metrics
+
+
+#===========================================
+# Checkpointer configuration
+#===========================================
+
+# memory : MemorySaver, every thread kept in RAM until restart
+# sqlite : local SQLite file with idle-thread TTL and a thread cap
+CHECKPOINTER = os.getenv("CHECKPOINTER", "sqlite").lower()
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints/checkpoints.sqlite")
+THREAD_TTL = float(os.getenv("THREAD_TTL", str(7 * 24 * 3600)))
+MAX_THREADS = int(os.getenv("MAX_THREADS", "10000"))
+
+
+#===========================================
+# Compact serialization
+#===========================================
+
+class CompressedSerializer:
+    """
+    JsonPlusSerializer (msgpack) output compressed with zlib. Message
+    history is repetitive text and typically shrinks 3-5x. Blobs written
+    before compression was enabled are still read.
+    """
+
+    SUFFIX = "+zlib"
+
+    def __init__(self, inner=None, level: int = 6):
+        self.inner = inner or JsonPlusSerializer()
+        self.level = level
+
+    def dumps_typed(self, obj) -> tuple[str, bytes]:
+        type_, data = self.inner.dumps_typed(obj)
+        if type_ in ("null", "empty") or not data:
+            return type_, data
+        return type_ + self.SUFFIX, zlib.compress(data, self.level)
+
+    def loads_typed(self, data: tuple[str, bytes]):
+        type_, blob = data
+        if type_.endswith(self.SUFFIX):
+            return self.inner.loads_typed((type_[:-len(self.SUFFIX)], zlib.decompress(blob)))
+        return self.inner.loads_typed(data)
+
+
+#===========================================
+# Evicting SQLite checkpointer
+#===========================================
+
+class EvictingSqliteSaver(AsyncSqliteSaver):
+    """
+    AsyncSqliteSaver for a chat server:
+
+    - only the latest checkpoint of each thread is kept (no time travel),
+      so a thread costs one row instead of one row per graph step;
+    - threads idle for longer than ttl seconds are deleted;
+    - past max_threads, the least recently active threads are deleted.
+
+    Eviction runs from aput at most every sweep_interval seconds, or
+    sooner once enough new writes have arrived.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, ttl: float = THREAD_TTL, max_threads: int = MAX_THREADS,
+                 sweep_interval: float = 60.0, sweep_every: int = 1000):
+        super().__init__(conn, serde=CompressedSerializer())
+        self.ttl = ttl
+        self.max_threads = max_threads
+        self.sweep_interval = sweep_interval
+        self.sweep_every = sweep_every
+        self._last_sweep = time.monotonic()
+        self._writes_since_sweep = 0
+        self.evicted = 0
+
+    async def setup(self) -> None:
+        if self.is_setup:
+            return
+        await super().setup()
+        async with self.lock:
+            await self.conn.executescript(
+                """
+                PRAGMA synchronous=NORMAL;
+                CREATE TABLE IF NOT EXISTS thread_activity (
+                    thread_id TEXT PRIMARY KEY,
+                    last_seen REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_thread_last_seen ON thread_activity(last_seen);
+                """
+            )
+            await self.conn.commit()
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        next_config = await super().aput(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+
+        async with self.lock:
+            # Older checkpoints of this thread, and the writes made on top
+            # of them, are already folded into the new one
+            await self.conn.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <> ?",
+                (thread_id, checkpoint_ns, checkpoint["id"]),
+            )
+            await self.conn.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <> ?",
+                (thread_id, checkpoint_ns, checkpoint["id"]),
+            )
+            await self.conn.execute(
+                "INSERT OR REPLACE INTO thread_activity (thread_id, last_seen) VALUES (?, ?)",
+                (thread_id, time.time()),
+            )
+            self._writes_since_sweep += 1
+            if (self._writes_since_sweep >= self.sweep_every
+                    or time.monotonic() - self._last_sweep >= self.sweep_interval):
+                await self._evict()
+            await self.conn.commit()
+        return next_config
+
+    async def _evict(self):
+        self._last_sweep = time.monotonic()
+        self._writes_since_sweep = 0
+
+        rows = await self.conn.execute_fetchall(
+            "SELECT thread_id FROM thread_activity WHERE last_seen < ?",
+            (time.time() - self.ttl,),
+        )
+        victims = [row[0] for row in rows]
+
+        ((count,),) = await self.conn.execute_fetchall("SELECT COUNT(*) FROM thread_activity")
+        excess = count - len(victims) - self.max_threads
+        if excess > 0:
+            rows = await self.conn.execute_fetchall(
+                "SELECT thread_id FROM thread_activity WHERE last_seen >= ? ORDER BY last_seen ASC LIMIT ?",
+                (time.time() - self.ttl, excess),
+            )
+            victims.extend(row[0] for row in rows)
+
+        if not victims:
+            return
+        params = [(thread_id,) for thread_id in victims]
+        for table in ("checkpoints", "writes", "thread_activity"):
+            await self.conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", params)
+        self.evicted += len(victims)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await super().adelete_thread(thread_id)
+        async with self.lock:
+            await self.conn.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+            await self.conn.commit()
+
+    async def astats(self) -> dict:
+        await self.setup()
+        async with self.lock:
+            ((threads,),) = await self.conn.execute_fetchall("SELECT COUNT(*) FROM thread_activity")
+        return {"backend": "sqlite", "threads": threads, "evicted": self.evicted,
+                "ttl_s": self.ttl, "max_threads": self.max_threads}
+
+
+#===========================================
+# Timing
+#===========================================
+
+CHECKPOINT_SECONDS = metrics.histogram(
+    "cortex_checkpoint_seconds", "Checkpoint latency: load (history read before a turn), save, writes", ["op"]
+)
+
+
+class TimedCheckpoints:
+    """Mixin recording how long a saver takes to load and save threads."""
+
+    async def aget_tuple(self, config):
+        with CHECKPOINT_SECONDS.time(op="load"):
+            return await super().aget_tuple(config)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with CHECKPOINT_SECONDS.time(op="save"):
+            return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = ""):
+        with CHECKPOINT_SECONDS.time(op="writes"):
+            return await super().aput_writes(config, writes, task_id, task_path)
+
+
+class TimedMemorySaver(TimedCheckpoints, MemorySaver):
+    pass
+
+
+class TimedSqliteSaver(TimedCheckpoints, EvictingSqliteSaver):
+    pass
+
+
+@asynccontextmanager
+async def open_checkpointer(kind: str = CHECKPOINTER, path: str = CHECKPOINT_DB):
+    """
+    The configured saver, set up and ready. A SQLite connection is closed
+    on exit (aiosqlite's worker thread isn't a daemon), so the server
+    opens it in its lifespan handler.
+    """
+    if kind == "memory":
+        yield TimedMemorySaver()
+    elif kind == "sqlite":
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        async with TimedSqliteSaver.from_conn_string(path) as saver:
+            await saver.setup()
+            yield saver
+    else:
+        raise ValueError(f"Unknown CHECKPOINTER '{kind}', expected 'memory' or 'sqlite'")
@@ -0,0 +1,143 @@
+import os
+import re
+
+
+#===========================================
+# Context budget
+#===========================================
+
+# Chunks fetched per query; packing keeps as many as fit the budget
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "6"))
+# Most tokens of document context put into the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+
+# Shortest suffix/prefix match treated as chunk overlap when a chunk has
+# no start_index (indexes built before it was recorded)
+MIN_OVERLAP = 20
+
+# Uploads are ingested from "temp_<uuid hex>_<original name>"
+_UPLOAD_PREFIX = re.compile(r"^temp_[0-9a-f]{32}_")
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token, same estimate as ingestion batching
+    return max(1, len(text) // 4) if text else 0
+
+
+def source_name(metadata: dict) -> str:
+    return _UPLOAD_PREFIX.sub("", os.path.basename(str(metadata.get("source", "document"))))
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is also a prefix of b."""
+    probe = b[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return 0
+    i = a.find(probe, max(0, len(a) - len(b)))
+    while i != -1:
+        if b.startswith(a[i:]):
+            return len(a) - i
+        i = a.find(probe, i + 1)
+    return 0
+
+
+#===========================================
+# Passages
+#===========================================
+
+class _Passage:
+    """A run of text from one page, built from one or more chunks."""
+
+    def __init__(self, doc, rank: int):
+        self.key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        self.metadata = doc.metadata
+        self.rank = rank
+        self.text = doc.page_content
+        self.start = doc.metadata.get("start_index")
+        self.end = self.start + len(self.text) if self.start is not None else None
+
+    def merged_with(self, text: str, start):
+        """Returns (text, start, end) if the chunk joins this passage, else None."""
+        if start is not None and self.start is not None:
+            end = start + len(text)
+            if start > self.end or end < self.start:
+                return None
+            merged = text[:self.start - start] + self.text if start < self.start else self.text
+            if end > self.end:
+                merged += text[self.end - start:]
+            return merged, min(start, self.start), max(end, self.end)
+
+        if text in self.text:
+            return self.text, self.start, self.end
+        if self.text in text:
+            return text, None, None
+        overlap = _overlap(self.text, text)
+        if overlap:
+            return self.text + text[overlap:], None, None
+        overlap = _overlap(text, self.text)
+        if overlap:
+            return text + self.text[overlap:], None, None
+        return None
+
+    def header(self, ref: int) -> str:
+        page = self.metadata.get("page_label", self.metadata.get("page"))
+        return f"[{ref}] {source_name(self.metadata)}" + (f", p. {page}" if page is not None else "")
+
+    def citation(self, ref: int) -> dict:
+        return {
+            "ref": ref,
+            "source": source_name(self.metadata),
+            "page": self.metadata.get("page_label", self.metadata.get("page")),
+        }
+
+
+#===========================================
+# Packing
+#===========================================
+
+def pack_context(docs: list, budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Turns retrieved chunks (most relevant first) into prompt context.
+
+    Chunks from the same page that overlap or touch are merged with the
+    overlap removed. Chunks are taken in relevance order while they fit
+    in `budget` tokens; one that doesn't fit is skipped so a smaller,
+    less relevant one can still be used. Each passage gets a short
+    citation header instead of its metadata dict.
+
+    Returns (context, citations, stats).
+    """
+    passages = []
+    used = 0
+
+    for rank, doc in enumerate(docs):
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        start = doc.metadata.get("start_index")
+        for passage in passages:
+            if passage.key != key:
+                continue
+            merged = passage.merged_with(doc.page_content, start)
+            if merged is None:
+                continue
+            added = estimate_tokens(merged[0]) - estimate_tokens(passage.text)
+            if used + added <= budget:
+                passage.text, passage.start, passage.end = merged
+                used += added
+            break
+        else:
+            passage = _Passage(doc, rank)
+            cost = estimate_tokens(passage.header(0)) + estimate_tokens(passage.text)
+            if used + cost <= budget:
+                passages.append(passage)
+                used += cost
+
+    passages.sort(key=lambda p: p.rank)
+    context = "\n\n".join(f"{p.header(i)}\n{p.text}" for i, p in enumerate(passages, 1))
+    citations = [p.citation(i) for i, p in enumerate(passages, 1)]
+    stats = {
+        "chunks": len(docs),
+        "passages": len(passages),
+        "raw_tokens": sum(estimate_tokens(doc.page_content) for doc in docs),
+        "packed_tokens": estimate_tokens(context),
+    }
+    return context, citations, stats
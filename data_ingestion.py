@@ -1,67 +1,574 @@
-import os
-import logging
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# 1. Setup Logging (Better than print for Servers)
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-embeddings = OpenAIEmbeddings(model='text-embedding-3-small')
-
-# 2. Add arguments for flexible paths
-def Ingest_Data(pdf_path: str, vector_db_path: str = "vectorstore/db_faiss"):
-    """
-    Ingests a PDF, splits it, and saves the vector store.
-    Returns a dict with status to send back to the Frontend.
-    """
-    try:
-        logger.info(f"Starting ingestion for: {pdf_path}")
-
-        # Validation: Check if file exists
-        if not os.path.exists(pdf_path):
-            raise FileNotFoundError(f"The file {pdf_path} was not found.")
-
-        # Load
-        loader = PyPDFLoader(pdf_path)
-        pages = loader.load_and_split()
-        
-        if not pages:
-            return {"status": "error", "message": "PDF contains no text."}
-
-        # Split
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=250)
-        docs = splitter.split_documents(pages)
-        logger.info(f"Processing {len(docs)} chunks...")
-
-        # Embed & Save
-        # Note: This is CPU/Network intensive. In FastAPI, 
-        # ensure you run this in a BackgroundTask or ThreadPool.
-        db = FAISS.from_documents(docs, embeddings) 
-        db.save_local(vector_db_path)
-        
-        logger.info(f"Saved vectorstore to {vector_db_path}")
-
-        # 3. Return JSON-friendly data
-        return {
-            "status": "success",
-            "chunks_processed": len(docs),
-            "db_path": vector_db_path,
-            "message": "File successfully ingested and indexed."
-        }
-
-    except Exception as e:
-        logger.error(f"Ingestion failed: {str(e)}")
-        return {
-            "status": "failed", 
-            "error": str(e)
-        }
-    
-
-    
+import os
+import time
+import random
+import pickle
+import shutil
+import hashlib
+import logging
+import threading
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_openai import OpenAIEmbeddings
+from dotenv import load_dotenv
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from faiss_index import (
+    DELTA_DIR_NAME, FAISS_INDEX_TYPE, TEMPLATE_NAME, make_store, save_store, load_store, append_store,
+    retrain_if_needed, list_delta_shards, path_lock,
+)
+from pdf_parsing import PARSE_WORKERS, PARALLEL_MIN_PAGES, count_pages, iter_pages_parallel
+from bm25 import BM25Index
+from context_packing import source_name
+import metrics
+
+load_dotenv()
+
+# 1. Setup Logging (Better than print for Servers)
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = 'text-embedding-3-small'
+# Retries are handled by embed_in_batches so 429s reach our adaptive backoff
+embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, max_retries=0)
+
+# Chunks are embedded through a persistent cache so re-uploads of the
+# same pages don't hit the embedding endpoint again. Its database is
+# opened by the first ingest.
+embedding_cache = EmbeddingCache()
+cached_embeddings = CachedEmbeddings(embeddings, embedding_cache, EMBEDDING_MODEL)
+
+# Once this many deltas pile up they are folded back into the base index,
+# so a cold start doesn't have to merge hundreds of tiny shards.
+MAX_DELTA_SHARDS = 20
+
+
+def _base_exists(vector_db_path: str) -> bool:
+    return os.path.exists(os.path.join(vector_db_path, "index.faiss"))
+
+
+#===========================================
+# Duplicate chunks
+#===========================================
+
+def chunk_key(doc) -> str:
+    """Identifies a chunk by the name of the file it came from and its text."""
+    return hashlib.sha256(f"{source_name(doc.metadata)}\x00{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+def indexed_chunk_keys(vector_db_path: str) -> set:
+    """chunk_key of every chunk in the base index and its delta shards."""
+    keys = set()
+    with path_lock(vector_db_path):
+        if not _base_exists(vector_db_path):
+            return keys
+        for folder in [vector_db_path] + list_delta_shards(vector_db_path):
+            with open(os.path.join(folder, "index.pkl"), "rb") as f:
+                docstore, _ = pickle.load(f)
+            keys.update(chunk_key(doc) for doc in docstore._dict.values())
+    return keys
+
+
+def _drop_indexed(docs, seen: set) -> list:
+    """The docs whose chunk_key isn't in seen; adds theirs to it."""
+    fresh = []
+    for doc in docs:
+        key = chunk_key(doc)
+        if key not in seen:
+            seen.add(key)
+            fresh.append(doc)
+    return fresh
+
+
+def compact_vector_store(vector_db_path: str = "vectorstore/db_faiss") -> int:
+    """
+    Merges every delta shard into the base index and removes the shards.
+    No embedding calls are made, this only rewrites the index on disk.
+    This is also where a flat base is retrained as FAISS_INDEX_TYPE once
+    it holds enough vectors.
+    Returns the number of shards that were folded in.
+    Holds the folder's path_lock throughout, so shards saved and reloads
+    started meanwhile wait for the new base instead of racing it.
+    """
+    with path_lock(vector_db_path):
+        shards = list_delta_shards(vector_db_path)
+        if not shards:
+            return 0
+
+        db = load_store(vector_db_path, embeddings)
+        for shard in shards:
+            append_store(db, load_store(shard, embeddings))
+        # A base that started out too small to train becomes IVF here
+        if retrain_if_needed(db):
+            logger.info(f"Trained {FAISS_INDEX_TYPE} index on {db.index.ntotal} vectors")
+        BM25Index.from_store(db).save(vector_db_path)
+        save_store(db, vector_db_path)
+
+        # Only the shards that were folded in; an incomplete one is kept
+        for shard in shards:
+            shutil.rmtree(shard, ignore_errors=True)
+    logger.info(f"Compacted {len(shards)} delta shards into {vector_db_path}")
+    return len(shards)
+
+
+#===========================================
+# Batched, concurrent embedding pipeline
+#===========================================
+
+EMBED_BATCH_TOKENS = 16_000      # token budget per embedding request
+EMBED_MAX_CONCURRENCY = 4        # in-flight embedding requests
+EMBED_MAX_RETRIES = 6
+EMBED_BASE_BACKOFF = 1.0         # seconds, doubled per retry
+EMBED_MAX_BACKOFF = 30.0
+
+
+def _estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text; good enough for budgeting
+    return max(1, len(text) // 4)
+
+
+def make_token_batches(texts: list[str], max_tokens: int = EMBED_BATCH_TOKENS) -> list[list[int]]:
+    """
+    Groups text indices into batches whose estimated token count stays
+    within max_tokens. A single oversized text gets a batch of its own.
+    """
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = _estimate_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+# Errors without a status code that are still worth retrying, matched by
+# class name so the openai/httpx/requests exceptions need no import
+TRANSIENT_ERRORS = {"APIConnectionError", "APITimeoutError", "TransportError", "ConnectionError", "Timeout"}
+
+
+def _status_code(error: Exception):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    return _status_code(error) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _is_transient(error: Exception) -> bool:
+    """429, 5xx, and connection or timeout errors; a 400/401/404 won't go away on retry."""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__) or _is_rate_limit(error)
+
+
+def _retry_after(error: Exception):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _AdaptiveLimiter:
+    """
+    Concurrency gate with AIMD behaviour: the limit halves on every 429
+    and grows back by one after a full window of successful requests.
+    """
+
+    def __init__(self, limit: int):
+        self.max_limit = limit
+        self.limit = limit
+        self.active = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def on_rate_limit(self):
+        with self._cond:
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self.limit < self.max_limit and self._successes >= self.limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+
+def embed_in_batches(
+    texts: list[str],
+    embedder,
+    max_batch_tokens: int = EMBED_BATCH_TOKENS,
+    max_concurrency: int = EMBED_MAX_CONCURRENCY,
+    max_retries: int = EMBED_MAX_RETRIES,
+):
+    """
+    Embeds texts in token-budgeted batches with bounded concurrency,
+    backing off (and lowering concurrency) when the endpoint returns 429.
+    Only rate limits, 5xx and connection errors are retried; anything
+    else, such as a bad API key, fails the call at once.
+    Returns (vectors, report) with vectors in the same order as texts.
+    """
+    batches = make_token_batches(texts, max_batch_tokens)
+    vectors = [None] * len(texts)
+    limiter = _AdaptiveLimiter(max_concurrency)
+    latencies = []
+    rate_limited = 0
+    stats_lock = threading.Lock()
+
+    def run_batch(batch_no: int, indices: list[int]):
+        nonlocal rate_limited
+        batch_texts = [texts[i] for i in indices]
+        tokens = sum(_estimate_tokens(t) for t in batch_texts)
+
+        for attempt in range(max_retries + 1):
+            with limiter:
+                start = time.perf_counter()
+                try:
+                    result = embedder.embed_documents(batch_texts)
+                    error = None
+                except Exception as e:
+                    error = e
+                latency = time.perf_counter() - start
+
+            if error is None:
+                limiter.on_success()
+                for i, vector in zip(indices, result):
+                    vectors[i] = vector
+                with stats_lock:
+                    latencies.append(latency)
+                logger.info(
+                    f"Embedded batch {batch_no + 1}/{len(batches)}: {len(indices)} chunks, "
+                    f"~{tokens} tokens in {latency * 1000:.0f} ms ({tokens / max(latency, 1e-6):.0f} tok/s)"
+                )
+                return
+
+            if attempt == max_retries or not _is_transient(error):
+                raise error
+
+            if _is_rate_limit(error):
+                limiter.on_rate_limit()
+                with stats_lock:
+                    rate_limited += 1
+            delay = _retry_after(error) or min(EMBED_MAX_BACKOFF, EMBED_BASE_BACKOFF * 2 ** attempt)
+            delay *= 0.5 + random.random()
+            logger.warning(f"Embedding batch {batch_no + 1} failed ({error}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        futures = [pool.submit(run_batch, n, indices) for n, indices in enumerate(batches)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    total_tokens = sum(_estimate_tokens(t) for t in texts)
+    latencies.sort()
+    report = {
+        "batches": len(batches),
+        "elapsed_s": round(elapsed, 3),
+        "batch_latency_ms_p50": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else 0.0,
+        "batch_latency_ms_max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        "chunks_per_sec": round(len(texts) / max(elapsed, 1e-6), 1),
+        "tokens_per_sec": round(total_tokens / max(elapsed, 1e-6), 1),
+        "rate_limited": rate_limited,
+    }
+    return vectors, report
+
+
+#===========================================
+# Index helpers
+#===========================================
+
+# Pages per window in streaming mode; bounds how much text and how many
+# chunks are held in memory at once.
+STREAM_WINDOW_PAGES = 16
+
+# Windows saved between two on_window calls in streaming mode. The first
+# window is handed over at once so a document becomes searchable early.
+STREAM_RELOAD_WINDOWS = int(os.getenv("STREAM_RELOAD_WINDOWS", "8"))
+
+
+def _embed_and_index(docs, template_path: str = None):
+    """
+    Embeds docs and builds an index of type FAISS_INDEX_TYPE. Delta shards
+    pass the base's template path so they share its quantizer (or stay
+    flat when the base has none) and can be merged into it.
+    """
+    texts = [doc.page_content for doc in docs]
+    embedder = cached_embeddings.counting()
+    vectors, report = embed_in_batches(texts, embedder)
+    report["cache_hits"], report["cache_misses"] = embedder.hits, embedder.misses
+    db = make_store(
+        texts,
+        vectors,
+        [doc.metadata for doc in docs],
+        embeddings,
+        template_path=template_path,
+    )
+    return db, report
+
+
+def _template_for(vector_db_path: str, rebuild: bool):
+    if rebuild:
+        return None
+    return os.path.join(vector_db_path, TEMPLATE_NAME)
+
+
+def _save_index(db, vector_db_path: str, rebuild: bool):
+    """
+    Saves db as a new delta shard when a base index exists, otherwise (or
+    when rebuild is set) as the base index. Returns the delta path or None.
+    The BM25 keyword index is written first: readers treat a shard as
+    complete once its index.pkl exists.
+    """
+    keywords = BM25Index.from_store(db)
+    with path_lock(vector_db_path):
+        if rebuild or not _base_exists(vector_db_path):
+            keywords.save(vector_db_path)
+            save_store(db, vector_db_path)
+            shutil.rmtree(os.path.join(vector_db_path, DELTA_DIR_NAME), ignore_errors=True)
+            logger.info(f"Saved vectorstore to {vector_db_path}")
+            return None
+
+        delta_path = os.path.join(
+            vector_db_path, DELTA_DIR_NAME, f"{time.time_ns()}_{uuid4().hex[:8]}"
+        )
+        keywords.save(delta_path)
+        db.save_local(delta_path)
+    logger.info(f"Saved delta shard to {delta_path}")
+    return delta_path
+
+
+def _iter_pages(pdf_path: str, parse_workers: int):
+    """
+    Yields the PDF's pages in order. Large PDFs are extracted across a
+    process pool; small ones aren't worth the worker start-up cost.
+    """
+    if parse_workers > 1 and count_pages(pdf_path) >= PARALLEL_MIN_PAGES:
+        yield from iter_pages_parallel(pdf_path, parse_workers)
+    else:
+        yield from PyPDFLoader(pdf_path).lazy_load()
+
+
+def _iter_page_windows(pdf_path: str, window_pages: int, parse_workers: int):
+    """
+    Yields lists of at most window_pages pages, parsing the PDF lazily.
+    """
+    window = []
+    for page in _iter_pages(pdf_path, parse_workers):
+        window.append(page)
+        if len(window) >= window_pages:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def _merge_reports(reports: list[dict]) -> dict:
+    elapsed = sum(r["elapsed_s"] for r in reports)
+    chunks = sum(r["chunks_per_sec"] * r["elapsed_s"] for r in reports)
+    tokens = sum(r["tokens_per_sec"] * r["elapsed_s"] for r in reports)
+    return {
+        "batches": sum(r["batches"] for r in reports),
+        "elapsed_s": round(elapsed, 3),
+        "batch_latency_ms_p50": max((r["batch_latency_ms_p50"] for r in reports), default=0.0),
+        "batch_latency_ms_max": max((r["batch_latency_ms_max"] for r in reports), default=0.0),
+        "chunks_per_sec": round(chunks / max(elapsed, 1e-6), 1),
+        "tokens_per_sec": round(tokens / max(elapsed, 1e-6), 1),
+        "rate_limited": sum(r["rate_limited"] for r in reports),
+        "cache_hits": sum(r["cache_hits"] for r in reports),
+        "cache_misses": sum(r["cache_misses"] for r in reports),
+    }
+
+
+INGEST_FILES = metrics.counter("cortex_ingest_files_total", "Ingested files by status", ["status"])
+INGEST_CHUNKS = metrics.counter("cortex_ingest_chunks_total", "Chunks embedded and indexed")
+INGEST_SECONDS = metrics.histogram(
+    "cortex_ingest_seconds", "Time to ingest one file",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+INGEST_CHUNKS_PER_SECOND = metrics.histogram(
+    "cortex_ingest_chunks_per_second", "Ingestion throughput per file",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+
+
+def _record_ingest(result: dict, start: float) -> dict:
+    elapsed = time.perf_counter() - start
+    INGEST_FILES.inc(status=result["status"])
+    INGEST_SECONDS.observe(elapsed)
+    chunks = result.get("chunks_processed", 0)
+    if chunks:
+        INGEST_CHUNKS.inc(chunks)
+        INGEST_CHUNKS_PER_SECOND.observe(chunks / max(elapsed, 1e-6))
+    return result
+
+
+# 2. Add arguments for flexible paths
+def Ingest_Data(
+    pdf_path: str,
+    vector_db_path: str = "vectorstore/db_faiss",
+    incremental: bool = True,
+    streaming: bool = False,
+    window_pages: int = STREAM_WINDOW_PAGES,
+    on_window=None,
+    reload_windows: int = STREAM_RELOAD_WINDOWS,
+    parse_workers: int = PARSE_WORKERS,
+):
+    """
+    Ingests a PDF, splits it, and saves the vector store.
+
+    With incremental=True (default) only the new chunks are embedded and
+    they are saved as a delta shard next to the existing index, so the
+    previous corpus is kept and the cost scales with the new document.
+    With incremental=False the index is rebuilt from this PDF alone.
+    Chunks already in the index (same file name and text, e.g. a
+    re-upload, or the unchanged pages of a revised document) are skipped.
+
+    With streaming=True pages are parsed lazily and go through
+    split -> embed -> save in windows of window_pages pages, so memory
+    stays flat for any document size. After the first window, then every
+    reload_windows windows and once more at the end, on_window(delta_paths)
+    is called with the shards saved since the previous call, which lets
+    the server make the first chunks searchable before the last page is
+    parsed. delta_paths is None when the index should be reloaded in full
+    instead (the window became the base index, or the shards were
+    compacted).
+
+    Once MAX_DELTA_SHARDS delta shards have piled up they are compacted
+    into the base index at the end of the upload.
+
+    PDFs with at least PARALLEL_MIN_PAGES pages are parsed across
+    parse_workers processes; pass parse_workers=1 to force serial parsing.
+
+    Returns a dict with status to send back to the Frontend.
+    """
+    start = time.perf_counter()
+    try:
+        logger.info(f"Starting ingestion for: {pdf_path}")
+
+        # Validation: Check if file exists
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"The file {pdf_path} was not found.")
+
+        # start_index lets retrieval merge neighbouring chunks and drop their overlap
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=250, add_start_index=True)
+        rebuild = not incremental or not _base_exists(vector_db_path)
+        mode = "rebuild" if rebuild else "append"
+        seen = set() if rebuild else indexed_chunk_keys(vector_db_path)
+        skipped = 0
+
+        if streaming:
+            chunks, windows, reports, delta_paths, pending = 0, 0, [], [], []
+            for window in _iter_page_windows(pdf_path, window_pages, parse_workers):
+                docs = splitter.split_documents(window)
+                fresh = _drop_indexed(docs, seen)
+                skipped += len(docs) - len(fresh)
+                docs = fresh
+                if not docs:
+                    continue
+                db, report = _embed_and_index(docs, _template_for(vector_db_path, rebuild))
+                delta_path = _save_index(db, vector_db_path, rebuild)
+                rebuild = False
+
+                chunks += len(docs)
+                windows += 1
+                reports.append(report)
+                logger.info(f"Window {windows}: {len(docs)} chunks indexed ({chunks} total)")
+
+                if delta_path:
+                    delta_paths.append(delta_path)
+                    pending.append(delta_path)
+                if on_window and (delta_path is None or windows == 1 or windows % reload_windows == 0):
+                    on_window(pending if delta_path else None)
+                    pending = []
+
+            if not chunks and not skipped:
+                return _record_ingest({"status": "error", "message": "PDF contains no text."}, start)
+            embed_report = _merge_reports(reports)
+            delta_path = None
+
+        else:
+            # Load
+            pages = list(_iter_pages(pdf_path, parse_workers))
+
+            if not pages:
+                return _record_ingest({"status": "error", "message": "PDF contains no text."}, start)
+
+            # Split
+            docs = splitter.split_documents(pages)
+            fresh = _drop_indexed(docs, seen)
+            skipped = len(docs) - len(fresh)
+            docs = fresh
+            logger.info(f"Processing {len(docs)} chunks ({skipped} already indexed)...")
+
+            # Embed & Save
+            # Note: This is CPU/Network intensive. In FastAPI,
+            # ensure you run this in a BackgroundTask or ThreadPool.
+            if docs:
+                db, embed_report = _embed_and_index(docs, _template_for(vector_db_path, rebuild))
+                delta_path = _save_index(db, vector_db_path, rebuild)
+            else:
+                embed_report, delta_path = _merge_reports([]), None
+            chunks = len(docs)
+
+        compacted = 0
+        if len(list_delta_shards(vector_db_path)) >= MAX_DELTA_SHARDS:
+            compacted = compact_vector_store(vector_db_path)
+        if streaming and on_window and (compacted or pending):
+            on_window(None if compacted else pending)
+
+        # 3. Return JSON-friendly data
+        result = {
+            "status": "success",
+            "mode": mode,
+            "chunks_processed": chunks,
+            "chunks_skipped": skipped,
+            "db_path": vector_db_path,
+            "delta_path": delta_path,
+            "compacted_shards": compacted,
+            "embedding_cache": {
+                "hits": embed_report["cache_hits"],
+                "misses": embed_report["cache_misses"],
+            },
+            "embedding": embed_report,
+            "message": "File successfully ingested and indexed."
+        }
+        if streaming:
+            result["windows"] = windows
+            result["delta_paths"] = delta_paths
+        return _record_ingest(result, start)
+
+    except Exception as e:
+        logger.error(f"Ingestion failed: {str(e)}")
+        return _record_ingest({
+            "status": "failed",
+            "error": str(e)
+        }, start)
+
+
+
 #Ingest_Data("MLBOOK.pdf")
\ No newline at end of file
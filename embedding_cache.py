@@ -0,0 +1,335 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+
+
+#===========================================
+# Persistent embedding cache
+#===========================================
+
+class EmbeddingCache:
+    """
+    Content-addressed on-disk store of embedding vectors.
+
+    Keys are sha256(model + text), so re-uploading the same (or a revised)
+    document only pays for the chunks whose text actually changed.
+    The store is capped at max_entries; the least recently used rows are
+    evicted first. The database is opened on first use, so creating a
+    cache at import time doesn't touch the disk.
+    """
+
+    def __init__(self, path: str = "vectorstore/embedding_cache.sqlite", max_entries: int = 200_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens (and creates) the database; called with the lock held."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict:
+        """Returns {key: vector} for the keys present in the cache."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            conn = self._connect()
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                marks = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                conn.commit()
+
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items: dict):
+        """Stores {key: vector} and evicts old rows if the cap is exceeded."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._connect().executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count <= self.max_entries:
+            return
+        # Evict down to 90% of the cap so we don't evict on every insert
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings instance so embed_documents only sends cache misses
+    to the embedding endpoint. Queries are passed straight through.
+    hits and misses count this wrapper's calls only; see counting().
+    """
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def counting(self) -> "CachedEmbeddings":
+        """
+        A wrapper over the same model and cache with its own counters, so
+        one ingest's hits and misses aren't mixed with a concurrent one's.
+        """
+        return CachedEmbeddings(self.underlying, self.cache, self.model_name)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(keys)
+        hits = sum(1 for key in keys if key in found)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(new_items)
+            found.update(new_items)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.underlying.embed_query(text)
+
+
+#===========================================
+# Query embedding LRU
+#===========================================
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings instance with a bounded in-process LRU for
+    embed_query, optionally backed by a shared on-disk EmbeddingCache so
+    several workers can reuse each other's query embeddings. The async
+    methods read and write the on-disk cache in a thread, off the event
+    loop.
+    Keys are the normalized query text plus the embedding model.
+
+    `underlying` may be a function returning the Embeddings instance; it
+    is then called on first use, which keeps client setup off startup.
+    """
+
+    def __init__(self, underlying, model_name: str, max_size: int = 4096, disk_cache: EmbeddingCache = None):
+        self._underlying = underlying if isinstance(underlying, Embeddings) else None
+        self._factory = underlying
+        self._build_lock = threading.Lock()
+        self.model_name = model_name
+        self.max_size = max_size
+        self.disk_cache = disk_cache
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._miss_seconds = 0.0
+
+    @property
+    def underlying(self) -> Embeddings:
+        if self._underlying is None:
+            with self._build_lock:
+                if self._underlying is None:
+                    self._underlying = self._factory()
+        return self._underlying
+
+    @underlying.setter
+    def underlying(self, embeddings: Embeddings):
+        self._underlying = embeddings
+
+    def _key(self, text: str) -> str:
+        return EmbeddingCache.make_key(self.model_name, "query\x00" + normalize_query(text))
+
+    def _from_lru(self, key: str):
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+        return vector
+
+    def _from_disk(self, key: str):
+        vector = self.disk_cache.get_many([key]).get(key)
+        if vector is not None:
+            self._remember(key, vector)
+            with self._lock:
+                self.disk_hits += 1
+        return vector
+
+    def lookup(self, text: str):
+        """Returns the cached vector for text, or None."""
+        key = self._key(text)
+        vector = self._from_lru(key)
+        if vector is None and self.disk_cache is not None:
+            vector = self._from_disk(key)
+        return vector
+
+    async def alookup(self, text: str):
+        """lookup for the event loop: the disk cache is read in a thread."""
+        key = self._key(text)
+        vector = self._from_lru(key)
+        if vector is None and self.disk_cache is not None:
+            vector = await asyncio.to_thread(self._from_disk, key)
+        return vector
+
+    def _remember(self, key: str, vector: list[float]):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+    def _add(self, key: str, vector: list[float], latency: float):
+        self._remember(key, vector)
+        with self._lock:
+            self.misses += 1
+            self._miss_seconds += latency
+
+    def store(self, text: str, vector: list[float], latency: float = 0.0):
+        """Adds a freshly computed vector and records the cost of the miss."""
+        key = self._key(text)
+        self._add(key, vector, latency)
+        if self.disk_cache is not None:
+            self.disk_cache.put_many({key: vector})
+
+    async def astore(self, text: str, vector: list[float], latency: float = 0.0):
+        """store for the event loop: the disk cache is written in a thread."""
+        key = self._key(text)
+        self._add(key, vector, latency)
+        if self.disk_cache is not None:
+            await asyncio.to_thread(self.disk_cache.put_many, {key: vector})
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self.lookup(text)
+        if vector is not None:
+            return vector
+        start = time.perf_counter()
+        vector = self.underlying.embed_query(text)
+        self.store(text, vector, time.perf_counter() - start)
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        vector = await self.alookup(text)
+        if vector is not None:
+            return vector
+        start = time.perf_counter()
+        vector = await self.underlying.aembed_query(text)
+        await self.astore(text, vector, time.perf_counter() - start)
+        return vector
+
+    async def awarm(self, texts: list[str]) -> int:
+        """
+        Embeds the texts not already in the LRU with one embed_documents
+        call and stores them, so the embed_query calls that follow are
+        hits. Returns how many texts were embedded.
+        """
+        missing = {}
+        for text in texts:
+            key = self._key(text)
+            with self._lock:
+                present = key in self._lru
+            if not present and key not in missing:
+                missing[key] = text
+        if not missing:
+            return 0
+
+        start = time.perf_counter()
+        vectors = await self.underlying.aembed_documents(list(missing.values()))
+        latency = (time.perf_counter() - start) / len(missing)
+        new_items = dict(zip(missing, vectors))
+        for key, vector in new_items.items():
+            self._add(key, vector, latency)
+        if self.disk_cache is not None:
+            await asyncio.to_thread(self.disk_cache.put_many, new_items)
+        return len(missing)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            served = self.hits + self.disk_hits
+            total = served + self.misses
+            avg_miss = self._miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "size": len(self._lru),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(served / total, 4) if total else 0.0,
+                "avg_miss_latency_ms": round(avg_miss * 1000, 1),
+                # Estimate: every hit would have cost an average miss
+                "saved_latency_s": round(served * avg_miss, 3),
+            }
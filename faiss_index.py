@@ -0,0 +1,282 @@
+import os
+import pickle
+import threading
+from uuid import uuid4
+import numpy as np
+import faiss
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+load_dotenv()
+
+
+#===========================================
+# Index configuration
+#===========================================
+
+# flat  : exact search, everything in RAM (the original behaviour)
+# ivf   : inverted file, searches FAISS_IVF_NPROBE of FAISS_IVF_NLIST cells
+# ivfpq : inverted file + product quantization, ~30x smaller vectors
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+
+# Serve the base index straight from the page cache instead of the heap
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0") == "1"
+
+IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "1024"))
+IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("FAISS_PQ_M", "64"))
+PQ_NBITS = 8
+
+# k-means wants ~39 points per centroid; PQ needs 2^nbits * 39 for its codebooks.
+# Below these sizes the index stays flat until a later compaction retrains it.
+MIN_TRAIN_POINTS = {"ivf": 39 * 16, "ivfpq": 39 * 2 ** PQ_NBITS}
+
+# Empty, already-trained copy of an IVF base index. Delta shards are
+# built from it so they share the base's quantizer and can be merged.
+TEMPLATE_NAME = "trained.faiss"
+
+
+#===========================================
+# Delta shards
+#===========================================
+
+# Delta shards live inside the index folder. FAISS.load_local only reads
+# index.faiss / index.pkl, so they never interfere with the base index.
+DELTA_DIR_NAME = "deltas"
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+
+def path_lock(path: str) -> threading.RLock:
+    """
+    The lock for one index folder. Held while its base or delta shards
+    are written, compacted or read, so a reader never loads a base that
+    is being rewritten and compaction never deletes a shard it didn't
+    fold in.
+    """
+    key = os.path.abspath(path)
+    with _path_locks_guard:
+        return _path_locks.setdefault(key, threading.RLock())
+
+
+def list_delta_shards(path: str) -> list[str]:
+    """
+    Returns the complete delta shard folders of an index, oldest first.
+    save_local writes index.pkl last, so a folder without it is a shard
+    still being written (or one a crash left behind) and is skipped.
+    """
+    delta_root = os.path.join(path, DELTA_DIR_NAME)
+    if not os.path.isdir(delta_root):
+        return []
+    return [
+        os.path.join(delta_root, name)
+        for name in sorted(os.listdir(delta_root))
+        if os.path.exists(os.path.join(delta_root, name, "index.pkl"))
+    ]
+
+
+#===========================================
+# Index building
+#===========================================
+
+def is_trained_type(index) -> bool:
+    return isinstance(faiss.downcast_index(index), faiss.IndexIVF)
+
+
+def build_index(vectors, index_type: str = FAISS_INDEX_TYPE, template_path: str = None, nlist: int = IVF_NLIST):
+    """
+    Builds a FAISS index holding vectors. template_path is passed for
+    delta shards: the base's trained template is reused, or the shard
+    stays flat if the base has none, since a shard trained on its own
+    can't be merged into the base. Otherwise IVF / IVF-PQ indexes are
+    trained on the vectors themselves when there are enough of them.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, d = vectors.shape
+
+    if template_path:
+        if os.path.exists(template_path):
+            index = faiss.read_index(template_path)
+        else:
+            # Flat base: compaction retrains base and shards together
+            index = faiss.IndexFlatL2(d)
+    elif index_type in MIN_TRAIN_POINTS and n >= MIN_TRAIN_POINTS[index_type]:
+        nlist = max(1, min(nlist, n // 39))
+        quantizer = faiss.IndexFlatL2(d)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, d, nlist)
+        else:
+            m = PQ_M
+            while d % m:
+                m -= 1
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, m, PQ_NBITS)
+        index.train(vectors)
+    else:
+        index = faiss.IndexFlatL2(d)
+
+    index.add(vectors)
+    set_nprobe(index)
+    return index
+
+
+def set_nprobe(index, nprobe: int = IVF_NPROBE):
+    if is_trained_type(index):
+        faiss.extract_index_ivf(index).nprobe = nprobe
+
+
+def make_store(texts, vectors, metadatas, embeddings, template_path: str = None, ids=None):
+    """
+    Equivalent of FAISS.from_embeddings that honours FAISS_INDEX_TYPE.
+    """
+    ids = ids or [str(uuid4()) for _ in texts]
+    index = build_index(vectors, template_path=template_path)
+    docstore = InMemoryDocstore({
+        id_: Document(page_content=text, metadata=metadata)
+        for id_, text, metadata in zip(ids, texts, metadatas)
+    })
+    return FAISS(embeddings, index, docstore, dict(enumerate(ids)))
+
+
+def write_atomic(path: str, write):
+    """
+    Calls write(temp_path) and renames the result over path. A reader that
+    has the old file open or memory-mapped keeps the old file; truncating
+    a mapped file in place would crash it.
+    """
+    temp_path = f"{path}.{uuid4().hex}.tmp"
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _dump_docstore(store, path: str):
+    with open(path, "wb") as f:
+        pickle.dump((store.docstore, store.index_to_docstore_id), f)
+
+
+def save_store(store, path: str):
+    """
+    save_local plus the trained template for IVF indexes. Every file is
+    replaced atomically (see write_atomic), so a live server can keep the
+    old base memory-mapped while it is rewritten.
+    """
+    os.makedirs(path, exist_ok=True)
+    write_atomic(os.path.join(path, "index.faiss"), lambda temp: faiss.write_index(store.index, temp))
+    write_atomic(os.path.join(path, "index.pkl"), lambda temp: _dump_docstore(store, temp))
+    template_path = os.path.join(path, TEMPLATE_NAME)
+    if is_trained_type(store.index):
+        template = faiss.clone_index(store.index)
+        template.reset()
+        write_atomic(template_path, lambda temp: faiss.write_index(template, temp))
+    elif os.path.exists(template_path):
+        os.remove(template_path)
+
+
+def mmap_flags(index_path: str) -> int:
+    with open(index_path, "rb") as f:
+        fourcc = f.read(4)
+    # IVF files ("IwFl", "IwPQ", ...) map their inverted lists; flat codes
+    # need the newer IO_FLAG_MMAP_IFC. The two flags can't be combined.
+    if fourcc.startswith((b"Iw", b"Iv")):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def load_store(path: str, embeddings, mmap: bool = False):
+    """
+    Same as FAISS.load_local, but can memory-map the index so a multi-GB
+    index is paged in on demand instead of being copied into the heap.
+    A memory-mapped index is read-only.
+    """
+    index_path = os.path.join(path, "index.faiss")
+    index = faiss.read_index(index_path, mmap_flags(index_path) if mmap else 0)
+    set_nprobe(index)
+
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def append_store(store, other):
+    """
+    Appends other's vectors and documents to store in place. Uses FAISS's
+    merge when the index types match, otherwise re-adds other's vectors.
+    Only a flat shard can be reconstructed exactly; anything else raises
+    ValueError rather than adding lossy copies of its vectors.
+    """
+    if type(faiss.downcast_index(store.index)) is type(faiss.downcast_index(other.index)):
+        # FAISS.merge_from doesn't pass add_id, which IVF indexes require
+        start = store.index.ntotal
+        add_id = start if is_trained_type(store.index) else 0
+        store.index.merge_from(other.index, add_id)
+        store.docstore.add({id_: other.docstore.search(id_) for id_ in other.index_to_docstore_id.values()})
+        store.index_to_docstore_id.update(
+            {start + i: id_ for i, id_ in other.index_to_docstore_id.items()}
+        )
+        return
+
+    if not isinstance(faiss.downcast_index(other.index), faiss.IndexFlat):
+        raise ValueError(
+            f"Can't merge a shard of type {type(faiss.downcast_index(other.index)).__name__} into an index of "
+            f"type {type(faiss.downcast_index(store.index)).__name__} without losing precision; "
+            "re-ingest its documents"
+        )
+    ids = [other.index_to_docstore_id[i] for i in range(other.index.ntotal)]
+    docs = [other.docstore.search(id_) for id_ in ids]
+    vectors = other.index.reconstruct_n(0, other.index.ntotal)
+    store.add_embeddings(
+        list(zip([doc.page_content for doc in docs], vectors.tolist())),
+        metadatas=[doc.metadata for doc in docs],
+        ids=ids,
+    )
+
+
+def retrain_if_needed(store, index_type: str = FAISS_INDEX_TYPE) -> bool:
+    """
+    Rebuilds a flat index as IVF / IVF-PQ once it has grown enough to
+    train on. Vector order is kept, so the docstore mapping stays valid.
+    """
+    index = faiss.downcast_index(store.index)
+    if index_type not in MIN_TRAIN_POINTS or not isinstance(index, faiss.IndexFlat):
+        return False
+    if index.ntotal < MIN_TRAIN_POINTS[index_type]:
+        return False
+    store.index = build_index(index.reconstruct_n(0, index.ntotal), index_type)
+    return True
+
+
+def attach_shard(store, *others):
+    """
+    Returns a new store that searches store's index and the others'
+    indexes side by side through faiss.IndexShards. Nothing is copied,
+    which is what lets a read-only memory-mapped base still pick up new
+    delta shards.
+    """
+    parts = list(getattr(store, "shard_indexes", [store.index])) + [other.index for other in others]
+    shards = faiss.IndexShards(store.index.d, False, True)
+    for part in parts:
+        shards.add_shard(part)
+
+    offset = store.index.ntotal
+    index_to_docstore_id = dict(store.index_to_docstore_id)
+    docs = dict(store.docstore._dict)
+    for other in others:
+        index_to_docstore_id.update({offset + i: id_ for i, id_ in other.index_to_docstore_id.items()})
+        docs.update(other.docstore._dict)
+        offset += other.index.ntotal
+
+    combined = FAISS(
+        store.embedding_function,
+        shards,
+        InMemoryDocstore(docs),
+        index_to_docstore_id,
+    )
+    # IndexShards doesn't own its sub-indexes; keep them alive with the store
+    combined.shard_indexes = parts
+    return combined
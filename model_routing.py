@@ -0,0 +1,313 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel, agenerate_from_stream
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+import metrics
+
+
+#===========================================
+# Routing configuration
+#===========================================
+
+# Seconds without a first token before the same request is also sent to
+# the next equivalent model: "auto" (the model's rolling p95 TTFT),
+# a fixed number of seconds, or "off"
+HEDGE_DELAY = os.getenv("HEDGE_DELAY", "auto").lower()
+HEDGE_DELAY_MIN = 0.25
+HEDGE_DELAY_MAX = 4.0
+# Used by "auto" until a model has MIN_SAMPLES first-token timings
+HEDGE_DELAY_DEFAULT = 2.0
+
+# Requests per model the rolling TTFT and error rate are computed over
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "50"))
+# Past this error rate a model is tried after its fallbacks, not before,
+# until ROUTER_COOLDOWN seconds pass without a new error
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+ROUTER_COOLDOWN = float(os.getenv("ROUTER_COOLDOWN", "30"))
+MIN_SAMPLES = 5
+
+_DONE = object()
+
+LLM_TTFT = metrics.histogram("cortex_llm_ttft_seconds", "Time to first token per model", ["model"])
+LLM_TOKENS_PER_SECOND = metrics.histogram(
+    "cortex_llm_tokens_per_second", "Streaming rate after the first token (one chunk counted as one token)",
+    ["model"], buckets=(5, 10, 25, 50, 100, 200, 400, 800, 1600),
+)
+LLM_OUTPUT_TOKENS = metrics.counter("cortex_llm_output_tokens_total", "Streamed chunks per model", ["model"])
+LLM_REQUESTS = metrics.counter("cortex_llm_requests_total", "Model requests by outcome", ["model", "outcome"])
+
+
+#===========================================
+# Per-model statistics
+#===========================================
+
+class ModelStats:
+    """Rolling time-to-first-token and error rate of one model."""
+
+    def __init__(self, name: str, window: int = ROUTER_WINDOW):
+        self.name = name
+        self.ttfts = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.wins = 0
+        self.last_error = 0.0
+
+    def record_ttft(self, seconds: float):
+        self.ttfts.append(seconds)
+        LLM_TTFT.observe(seconds, model=self.name)
+
+    def record_stream(self, tokens: int, seconds: float):
+        LLM_OUTPUT_TOKENS.inc(tokens, model=self.name)
+        if tokens > 1 and seconds > 0:
+            LLM_TOKENS_PER_SECOND.observe((tokens - 1) / seconds, model=self.name)
+
+    def record(self, ok: bool):
+        self.outcomes.append(ok)
+        LLM_REQUESTS.inc(model=self.name, outcome="ok" if ok else "error")
+        if not ok:
+            self.errors += 1
+            self.last_error = time.monotonic()
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def ttft_percentile(self, p: float):
+        if len(self.ttfts) < MIN_SAMPLES:
+            return None
+        return float(np.percentile(self.ttfts, p))
+
+    def healthy(self) -> bool:
+        if len(self.outcomes) < MIN_SAMPLES or self.error_rate() <= ROUTER_MAX_ERROR_RATE:
+            return True
+        # Let it take traffic again after a quiet spell, so it can recover
+        return time.monotonic() - self.last_error > ROUTER_COOLDOWN
+
+    def summary(self) -> dict:
+        p50, p95 = self.ttft_percentile(50), self.ttft_percentile(95)
+        return {
+            "requests": self.requests,
+            "wins": self.wins,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate(), 3),
+            "ttft_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "ttft_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "healthy": self.healthy(),
+        }
+
+
+#===========================================
+# Attempts
+#===========================================
+
+class _Attempt:
+    """
+    One model streaming one request in its own task. The first item
+    (chunk, end marker or exception) resolves `first`; the rest are
+    queued. Running each attempt in its own task keeps the provider's
+    HTTP stream inside one task and makes losers cheap to cancel.
+    """
+
+    def __init__(self, name: str, model, messages, kwargs: dict):
+        self.name = name
+        self.start = time.perf_counter()
+        self.ttft = None
+        self.failed = False
+        self.first = asyncio.get_running_loop().create_future()
+        self.queue = asyncio.Queue()
+        self.task = asyncio.ensure_future(self._pump(model, messages, kwargs))
+
+    def _put(self, item):
+        if self.first.done():
+            self.queue.put_nowait(item)
+            return
+        self.ttft = time.perf_counter() - self.start
+        self.first.set_result(item)
+
+    async def _pump(self, model, messages, kwargs):
+        try:
+            # No callbacks: only the routed model reports tokens, so a
+            # losing hedge never reaches the client stream
+            async for chunk in model.astream(messages, config={"callbacks": []}, **kwargs):
+                self._put(chunk)
+            self._put(_DONE)
+        except Exception as e:
+            self._put(e)
+
+
+#===========================================
+# Router
+#===========================================
+
+class ModelRouter:
+    """
+    Routes a request for a named model across it and its fallbacks.
+
+    The requested model goes first unless it is unhealthy. If it errors
+    before its first token, the next fallback is tried (failover). If it
+    hasn't produced a first token within the hedge delay, the request is
+    also sent to the next fallback and whichever streams first is used;
+    the other is cancelled. Errors after the first token are raised,
+    since part of the answer has already been streamed.
+
+    `models` maps names to chat models, or to functions that build one,
+    so clients are only created for models that are actually used.
+    """
+
+    def __init__(self, models: dict, fallbacks: dict, hedge_delay: str = HEDGE_DELAY):
+        self.models = models
+        self.fallbacks = fallbacks
+        self.hedge_setting = hedge_delay
+        self.stats = {name: ModelStats(name) for name in models}
+        self.hedges = 0
+        self.failovers = 0
+
+    def model(self, name: str):
+        """The client for name; entries given as factories are built on first use."""
+        model = self.models[name]
+        if not isinstance(model, BaseChatModel):
+            model = self.models[name] = model()
+        return model
+
+    def candidates(self, name: str) -> list[str]:
+        names = [name] + [n for n in self.fallbacks.get(name, []) if n in self.models and n != name]
+        # Stable: configured order among healthy models, unhealthy ones last
+        return sorted(names, key=lambda n: not self.stats[n].healthy())
+
+    def hedge_delay(self, name: str):
+        if self.hedge_setting == "off":
+            return None
+        if self.hedge_setting != "auto":
+            return float(self.hedge_setting)
+        p95 = self.stats[name].ttft_percentile(95)
+        if p95 is None:
+            return HEDGE_DELAY_DEFAULT
+        return min(HEDGE_DELAY_MAX, max(HEDGE_DELAY_MIN, p95))
+
+    def _launch(self, attempts: list, queue: list, messages, kwargs: dict):
+        name = queue.pop(0)
+        self.stats[name].requests += 1
+        attempts.append(_Attempt(name, self.model(name), messages, kwargs))
+
+    async def astream(self, name: str, messages, **kwargs):
+        """Yields the message chunks of whichever model answers first."""
+        queue = self.candidates(name)
+        attempts, winner, last_error = [], None, None
+        tokens = 0
+        self._launch(attempts, queue, messages, kwargs)
+
+        try:
+            while winner is None:
+                live = [a for a in attempts if not a.first.done()]
+                if not live:
+                    if not queue:
+                        raise last_error
+                    self.failovers += 1
+                    self._launch(attempts, queue, messages, kwargs)
+                    continue
+
+                timeout = None
+                delay = self.hedge_delay(attempts[-1].name)
+                if queue and delay is not None and len(live) < 2:
+                    timeout = max(0.0, delay - (time.perf_counter() - attempts[-1].start))
+                done, _ = await asyncio.wait([a.first for a in live], timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedges += 1
+                    self._launch(attempts, queue, messages, kwargs)
+                    continue
+
+                for attempt in live:
+                    if not attempt.first.done():
+                        continue
+                    item = attempt.first.result()
+                    if isinstance(item, Exception):
+                        print(f"Model '{attempt.name}' failed, trying a fallback: {item}")
+                        self.stats[attempt.name].record(False)
+                        attempt.failed = True
+                        last_error = item
+                    elif winner is None:
+                        winner = attempt
+
+            stats = self.stats[winner.name]
+            stats.wins += 1
+            stats.record_ttft(winner.ttft)
+            item = winner.first.result()
+            while item is not _DONE:
+                if isinstance(item, Exception):
+                    stats.record(False)
+                    winner.failed = True
+                    raise item
+                tokens += bool(item.content)
+                yield item
+                item = await winner.queue.get()
+        finally:
+            # Finished, or closed early by the caller: either way it answered
+            if winner is not None and not winner.failed:
+                self.stats[winner.name].record(True)
+                streaming = time.perf_counter() - winner.start - winner.ttft
+                self.stats[winner.name].record_stream(tokens, streaming)
+            for attempt in attempts:
+                attempt.task.cancel()
+                # Losers cancelled before their first token leave no sample:
+                # counting the time they waited would drag p95, and so the
+                # hedge delay, up towards the very tail being hedged
+                if attempt is winner or attempt.failed:
+                    continue
+                if attempt.first.done() and not isinstance(attempt.first.result(), Exception):
+                    self.stats[attempt.name].record_ttft(attempt.ttft)
+                LLM_REQUESTS.inc(model=attempt.name, outcome="cancelled")
+
+    def invoke(self, name: str, messages, **kwargs):
+        """Blocking call with failover only; the graph itself uses astream."""
+        last_error = None
+        for candidate in self.candidates(name):
+            stats = self.stats[candidate]
+            stats.requests += 1
+            try:
+                message = self.model(candidate).invoke(messages, config={"callbacks": []}, **kwargs)
+            except Exception as e:
+                stats.record(False)
+                last_error = e
+                continue
+            stats.record(True)
+            stats.wins += 1
+            return message
+        raise last_error
+
+    def summary(self) -> dict:
+        return {
+            "hedge_delay": self.hedge_setting,
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "models": {name: stats.summary() for name, stats in self.stats.items()},
+        }
+
+
+class RoutedChatModel(BaseChatModel):
+    """Chat model that answers through a ModelRouter for `model_name`."""
+
+    router: Any
+    model_name: str
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message = self.router.invoke(self.model_name, messages, stop=stop, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        async for message in self.router.astream(self.model_name, messages, stop=stop, **kwargs):
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager:
+                await run_manager.on_llm_new_token(message.content, chunk=chunk)
+            yield chunk
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
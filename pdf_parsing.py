@@ -0,0 +1,65 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
+
+# This module is imported by every worker process, so it deliberately
+# only depends on pypdf; langchain is imported lazily in the parent.
+
+PARSE_WORKERS = os.cpu_count() or 1
+PARALLEL_MIN_PAGES = 64        # smaller PDFs aren't worth the process start-up
+PAGES_PER_TASK = 32
+
+
+def count_pages(pdf_path: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> list[tuple]:
+    """
+    Extracts text for pages [start, end) in a worker process.
+    Returns (page_number, page_label, text) tuples in page order.
+    """
+    reader = PdfReader(pdf_path)
+    labels = reader.page_labels
+    return [
+        (i, labels[i], reader.pages[i].extract_text(extraction_mode="plain").strip())
+        for i in range(start, end)
+    ]
+
+
+def iter_pages_parallel(pdf_path: str, workers: int = PARSE_WORKERS, pages_per_task: int = PAGES_PER_TASK):
+    """
+    Yields one Document per page, in page order, with page ranges extracted
+    across a process pool. Metadata matches PyPDFLoader (source, page,
+    page_label, total_pages). At most 2 * workers ranges are in flight, so
+    a slow consumer doesn't make the whole document pile up in memory.
+    """
+    from langchain_core.documents import Document
+
+    total_pages = count_pages(pdf_path)
+    ranges = deque(
+        (start, min(start + pages_per_task, total_pages))
+        for start in range(0, total_pages, pages_per_task)
+    )
+
+    # spawn rather than fork: the server process runs threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        in_flight = deque()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < 2 * workers:
+                start, end = ranges.popleft()
+                in_flight.append(pool.submit(extract_page_range, pdf_path, start, end))
+
+            for page_number, page_label, text in in_flight.popleft().result():
+                yield Document(
+                    page_content=text,
+                    metadata={
+                        "source": pdf_path,
+                        "total_pages": total_pages,
+                        "page": page_number,
+                        "page_label": page_label,
+                    },
+                )
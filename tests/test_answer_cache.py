@@ -0,0 +1,76 @@
+import os
+import asyncio
+from typing import Any
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+os.environ.setdefault("CHECKPOINTER", "memory")
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import RAG
+from benchmarks.fakes import HashEmbeddings
+from faiss_index import make_store
+
+
+class HistoryEchoModel(BaseChatModel):
+    """Answers with the first user message it was sent, so the reply depends on the history."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "history-echo"
+
+    @staticmethod
+    def _reply(messages) -> str:
+        first = next(m.content for m in messages if isinstance(m, HumanMessage))
+        return f"echo: {first[:40]}"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        yield ChatGenerationChunk(message=AIMessageChunk(content=self._reply(messages)))
+
+
+@pytest.fixture(autouse=True)
+def fake_backends():
+    embedder = HashEmbeddings(latency=0)
+    RAG.embeddings.underlying = embedder
+    texts = [f"Passage {i} about topic {i % 5}." for i in range(20)]
+    store = make_store(texts, embedder.embed_documents(texts), [{"page": i} for i in range(len(texts))], RAG.embeddings)
+    RAG.collection_indexes.get(RAG.DEFAULT_COLLECTION)
+    RAG.vector_store.swap(store, [])
+    RAG.model_router.models = {name: HistoryEchoModel() for name in RAG.MODELS}
+    RAG.answer_cache.clear()
+    yield
+    RAG.answer_cache.clear()
+
+
+def test_threads_with_different_history_do_not_share_answers():
+    async def run():
+        await RAG.aask_bot("My secret is swordfish", thread_id="thread-a")
+        await RAG.aask_bot("Hello there", thread_id="thread-b")
+
+        answer_a = await RAG.aask_bot("What does passage 3 say?", use_rag=True, thread_id="thread-a")
+        answer_b = await RAG.aask_bot("What does passage 3 say?", use_rag=True, thread_id="thread-b")
+        return answer_a, answer_b
+
+    answer_a, answer_b = asyncio.run(run())
+    assert "swordfish" in answer_a
+    assert "swordfish" not in answer_b
+    assert RAG.answer_cache.stats()["hits"] == 0
+
+
+def test_new_threads_share_answers():
+    async def run():
+        first = await RAG.aask_bot("What does passage 3 say?", use_rag=True, thread_id="fresh-a")
+        second = await RAG.aask_bot("What does passage 3 say?", use_rag=True, thread_id="fresh-b")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert RAG.answer_cache.stats()["hits"] == 1
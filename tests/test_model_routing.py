@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+import model_routing
+from benchmarks.fakes import FakeStreamingChatModel
+from model_routing import MIN_SAMPLES, ModelRouter
+
+MESSAGES = [HumanMessage(content="hello")]
+
+
+def make_router(hedge_delay="off", **models):
+    names = list(models)
+    fallbacks = {name: [n for n in names if n != name] for name in names}
+    return ModelRouter(models, fallbacks, hedge_delay=hedge_delay)
+
+
+def stream(router, name):
+    async def run():
+        return "".join([chunk.content async for chunk in router.astream(name, MESSAGES)])
+    return asyncio.run(run())
+
+
+def test_failover_to_next_model_when_primary_errors():
+    router = make_router(
+        primary=FakeStreamingChatModel(reply="from primary", error_rate=1.0, ttft=0),
+        backup=FakeStreamingChatModel(reply="from backup", ttft=0, token_delay=0),
+    )
+    assert stream(router, "primary") == "from backup"
+    assert router.failovers == 1
+    assert router.stats["primary"].errors == 1
+    assert router.stats["backup"].wins == 1
+
+
+def test_hedge_answers_from_fallback_when_primary_is_slow():
+    router = make_router(
+        hedge_delay="0.05",
+        primary=FakeStreamingChatModel(reply="from primary", ttft=2.0),
+        backup=FakeStreamingChatModel(reply="from backup", ttft=0, token_delay=0),
+    )
+    start = time.perf_counter()
+    assert stream(router, "primary") == "from backup"
+    assert time.perf_counter() - start < 1.0
+    assert router.hedges == 1
+    assert router.failovers == 0
+    assert router.stats["backup"].wins == 1
+    assert router.stats["primary"].wins == 0
+
+
+def test_last_error_is_raised_when_every_candidate_fails():
+    router = make_router(
+        primary=FakeStreamingChatModel(error_rate=1.0, ttft=0),
+        backup=FakeStreamingChatModel(error_rate=1.0, ttft=0),
+    )
+    with pytest.raises(ConnectionError):
+        stream(router, "primary")
+    with pytest.raises(ConnectionError):
+        router.invoke("primary", MESSAGES)
+    assert router.stats["primary"].errors == 2
+    assert router.stats["backup"].errors == 2
+
+
+def test_failing_model_is_tried_last_until_cooldown_passes(monkeypatch):
+    router = make_router(
+        primary=FakeStreamingChatModel(reply="from primary", ttft=0, token_delay=0),
+        backup=FakeStreamingChatModel(reply="from backup", ttft=0, token_delay=0),
+    )
+    for _ in range(MIN_SAMPLES):
+        router.stats["primary"].record(False)
+
+    assert not router.stats["primary"].healthy()
+    assert router.candidates("primary") == ["backup", "primary"]
+    assert stream(router, "primary") == "from backup"
+
+    monkeypatch.setattr(model_routing, "ROUTER_COOLDOWN", 0.0)
+    assert router.stats["primary"].healthy()
+    assert router.candidates("primary") == ["primary", "backup"]
+    assert stream(router, "primary") == "from primary"
@@ -0,0 +1,37 @@
+import io
+import asyncio
+
+import pytest
+
+import utils
+from benchmarks.fakes import StubTranscriber, make_wav
+
+
+class Upload:
+    def __init__(self, data: bytes, filename: str = "question.wav"):
+        self.filename = filename
+        self._buffer = io.BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+
+def test_long_recording_segments_are_offset_by_piece_start(monkeypatch):
+    transcriber = StubTranscriber(latency=0, seconds_per_audio_second=0)
+    monkeypatch.setattr(utils, "_client", transcriber)
+    data = make_wav(75)
+
+    pieces = utils.split_on_silence(data)
+    result = asyncio.run(utils.STT(Upload(data)))
+
+    assert len(pieces) > 1
+    assert transcriber.calls == len(pieces)
+    offsets = [offset for offset, _ in pieces]
+    assert [segment["start"] for segment in result["segments"]] == [round(offset, 3) for offset in offsets]
+    assert [segment["id"] for segment in result["segments"]] == list(range(len(pieces)))
+    # Each piece ends where the next one starts, and the last at the end of the recording
+    ends = [segment["end"] for segment in result["segments"]]
+    assert ends == pytest.approx(offsets[1:] + [75.0], abs=0.01)
+    assert result["language"] == "english"
+    assert result["text"].count("Stub transcript") == len(pieces)
+
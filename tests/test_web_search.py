@@ -0,0 +1,31 @@
+import os
+import asyncio
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+os.environ.setdefault("CHECKPOINTER", "memory")
+
+import RAG
+from benchmarks.fakes import StubSearch
+
+
+def test_concurrent_identical_searches_share_one_call():
+    search = StubSearch(latency=0.1)
+    RAG.set_search_backend(search)
+    coalesced = RAG._web_search_flight.coalesced
+
+    async def run():
+        return await asyncio.gather(
+            *(RAG._cached_search(query) for query in ["Latest news?"] * 5 + ["  latest NEWS? "])
+        )
+
+    results = asyncio.run(run())
+    assert search.calls == 1
+    assert all(result == results[0] for result in results)
+    assert RAG._web_search_flight.coalesced - coalesced == 5
+
+    # Later identical searches are answered from the cache
+    asyncio.run(RAG._cached_search("latest news?"))
+    assert search.calls == 1
+    RAG.set_search_backend(None)
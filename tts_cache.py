@@ -0,0 +1,183 @@
+import os
+import time
+import hashlib
+import threading
+from uuid import uuid4
+from collections import OrderedDict
+
+
+#===========================================
+# TTS audio cache
+#===========================================
+
+class TTSCache:
+    """
+    Content-addressed store of synthesized audio files.
+
+    Files are named sha256(voice + text), so a repeated phrase is
+    synthesized once. Total size is capped at max_bytes; past it the least
+    recently used files are deleted. Recency is tracked in memory (the
+    directory is scanned once, ordered by mtime, which a hit refreshes so
+    the order survives a restart). Files used within the last min_age
+    seconds are never evicted, so a hit can't disappear before it is
+    served. Audio is written to a temporary file and only renamed into
+    place once synthesis completes, so a failed or abandoned synthesis
+    never becomes a cache entry.
+    """
+
+    def __init__(self, directory: str = "outputs/tts_cache", max_bytes: int = 200 * 2 ** 20,
+                 min_age: float = 5.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index = None          # path -> (size, last used), oldest first; scanned on first use
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text: str, voice: str) -> str:
+        return hashlib.sha256(f"{voice}\n{text}".encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def _load(self):
+        """Builds the index from the directory; called with the lock held."""
+        if self._index is not None:
+            return
+        entries = []
+        if os.path.isdir(self.directory):
+            self._remove_stale_parts()
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".mp3"):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        # Files found on disk are evictable right away, until their next hit
+        self._index = OrderedDict((path, (size, 0.0)) for _, size, path in entries)
+        self._size = sum(size for _, size, _ in entries)
+
+    def get(self, text: str, voice: str):
+        """Path of the cached audio, or None."""
+        path = self.path(self.make_key(text, voice))
+        with self._lock:
+            self._load()
+            entry = self._index.get(path)
+            if entry is not None:
+                self._index[path] = (entry[0], time.monotonic())
+                self._index.move_to_end(path)
+        if entry is not None:
+            try:
+                os.utime(path)
+                self.hits += 1
+                return path
+            except FileNotFoundError:
+                # Deleted behind the cache's back
+                self._forget(path)
+        self.misses += 1
+        return None
+
+    def begin(self, text: str, voice: str) -> "PendingAudio":
+        """A temporary file to write new audio into; see PendingAudio."""
+        os.makedirs(self.directory, exist_ok=True)
+        return PendingAudio(self, self.make_key(text, voice))
+
+    def _forget(self, path: str):
+        with self._lock:
+            entry = self._index.pop(path, None)
+            if entry is not None:
+                self._size -= entry[0]
+
+    def _remove_stale_parts(self, max_age: float = 3600.0):
+        """Temporary files left behind by a crash mid-synthesis."""
+        cutoff = time.time() - max_age
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    if entry.name.endswith(".part") and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+
+    def _added(self, path: str, size: int):
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            self._load()
+            # Replacing an existing file (e.g. another process wrote it too)
+            previous = self._index.pop(path, None)
+            if previous is not None:
+                self._size -= previous[0]
+            self._index[path] = (size, now)
+            self._size += size
+            # Oldest first; the file just added (and anything used within
+            # min_age, i.e. about to be served) is kept even over the cap
+            while self._size > self.max_bytes:
+                old, (old_size, used_at) = next(iter(self._index.items()))
+                if old == path or now - used_at < self.min_age:
+                    break
+                del self._index[old]
+                self._size -= old_size
+                victims.append(old)
+        for old in victims:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "bytes": self._size if self._index is not None else None,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class PendingAudio:
+    """
+    Audio being synthesized: write() chunks as they arrive, then commit()
+    to move the file into the cache, or discard() to drop it. discard()
+    after commit() does nothing, so it can sit in a finally block.
+    commit() may delete evicted files, so async callers run it in a thread.
+    """
+
+    def __init__(self, cache: TTSCache, key: str):
+        self.cache = cache
+        self.final_path = cache.path(key)
+        self.temp_path = f"{self.final_path}.{uuid4().hex}.part"
+        self.size = 0
+        self._file = open(self.temp_path, "wb")
+
+    def write(self, data: bytes):
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self) -> str:
+        self._file.close()
+        # Atomic; a copy of the same audio already in place is replaced
+        os.replace(self.temp_path, self.final_path)
+        self.temp_path = None
+        self.cache._added(self.final_path, self.size)
+        return self.final_path
+
+    def discard(self):
+        if self.temp_path is None:
+            return
+        self._file.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+        self.temp_path = None
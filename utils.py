@@ -1,55 +1,291 @@
-import os
-from uuid import uuid4
-import edge_tts
-from groq import Groq
-from dotenv import load_dotenv
-
-load_dotenv()
-
-client = Groq()
-
-# ==================================================
-# 🎧 SPEECH TO TEXT
-# ==================================================
-
-async def STT(audio_file):
-    os.makedirs("uploads", exist_ok=True)
-    file_path = f"uploads/{uuid4().hex}.wav"
-
-    with open(file_path, "wb") as f:
-        f.write(await audio_file.read())
-
-    with open(file_path, "rb") as f:
-        transcription = client.audio.transcriptions.create(
-            file=f,
-            model="whisper-large-v3-turbo",
-            response_format="verbose_json",
-            temperature=0.0
-        )
-    
-    # Optional: cleanup the uploaded file after processing
-    # os.remove(file_path)
-
-    return {
-        "text": transcription.text,
-        "segments": transcription.segments,
-        "language": transcription.language
-    }
-
-
-# ==================================================
-# 🗣️ TEXT TO SPEECH
-# ==================================================
-
-async def TTS(text: str, voice: str = "en-US-AriaNeural") -> str:
-    """
-    Converts text to speech and saves it to a file.
-    Returns the path to the generated audio file.
-    """
-    os.makedirs("outputs", exist_ok=True)
-    filename = f"outputs/{uuid4().hex}.mp3"
-    
-    communicate = edge_tts.Communicate(text, voice)
-    await communicate.save(filename)
-    
-    return filename
\ No newline at end of file
+import io
+import os
+import wave
+import asyncio
+import numpy as np
+from dotenv import load_dotenv
+from tts_cache import TTSCache
+from search_cache import SingleFlight
+import metrics
+
+load_dotenv()
+
+# The Groq SDK and edge_tts are imported on first use, not when the chat
+# server starts.
+_client = None
+_communicate = None
+
+def get_client():
+    global _client
+    if _client is None:
+        from groq import AsyncGroq
+        _client = AsyncGroq()
+    return _client
+
+def set_stt_client(client):
+    """
+    Replaces the AsyncGroq client STT transcribes with, e.g. by a local
+    stub such as benchmarks.fakes.StubTranscriber.
+    """
+    global _client
+    _client = client
+
+def get_communicate():
+    global _communicate
+    if _communicate is None:
+        import edge_tts
+        _communicate = edge_tts.Communicate
+    return _communicate
+
+def set_tts_backend(communicate):
+    """
+    Replaces edge_tts.Communicate for TTS: any callable taking (text, voice)
+    and returning an object whose stream() yields edge_tts-style items,
+    {"type": "audio", "data": bytes} among them.
+    """
+    global _communicate
+    _communicate = communicate
+
+# ==================================================
+# 🎧 SPEECH TO TEXT
+# ==================================================
+
+STT_MODEL = "whisper-large-v3-turbo"
+# WAV recordings longer than 1.5x this many seconds are split at pauses
+# into pieces of about this length, which are transcribed concurrently
+STT_SEGMENT_SECONDS = float(os.getenv("STT_SEGMENT_SECONDS", "30"))
+STT_MAX_CONCURRENCY = int(os.getenv("STT_MAX_CONCURRENCY", "4"))
+# A pause is at least STT_MIN_SILENCE seconds quieter than STT_SILENCE_DB (dBFS)
+STT_SILENCE_DB = float(os.getenv("STT_SILENCE_DB", "-40"))
+STT_MIN_SILENCE = 0.3
+
+# Largest audio upload /stt accepts
+STT_MAX_UPLOAD_MB = float(os.getenv("STT_MAX_UPLOAD_MB", "100"))
+
+UPLOAD_CHUNK_BYTES = 1 << 20
+FRAME_SECONDS = 0.03
+# Samples converted to float at a time when measuring loudness
+RMS_BLOCK_SAMPLES = 1 << 16
+
+class UploadTooLarge(ValueError):
+    pass
+
+async def _read_upload(audio_file, max_bytes: int = int(STT_MAX_UPLOAD_MB * 2 ** 20)) -> bytes:
+    buffer = bytearray()
+    while chunk := await audio_file.read(UPLOAD_CHUNK_BYTES):
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise UploadTooLarge(f"Audio upload is larger than {STT_MAX_UPLOAD_MB:g} MB")
+    return bytes(buffer)
+
+def _frame_rms(samples: np.ndarray, hop: int, width: int) -> np.ndarray:
+    """
+    RMS of consecutive hop-sample frames, channels averaged, relative to
+    full scale. samples is the (frames, channels) integer view of the WAV
+    data; it is converted a block at a time, never as a whole.
+    """
+    n = len(samples) // hop
+    rms = np.empty(n, dtype=np.float32)
+    frames_per_block = max(1, RMS_BLOCK_SAMPLES // hop)
+    # 8-bit WAV is unsigned
+    zero, full_scale = (128, 128) if width == 1 else (0, 2 ** (8 * width - 1))
+    for first in range(0, n, frames_per_block):
+        last = min(n, first + frames_per_block)
+        block = samples[first * hop:last * hop].astype(np.float32).mean(axis=1)
+        block = (block - zero) / full_scale
+        rms[first:last] = np.sqrt(np.mean(block.reshape(last - first, hop) ** 2, axis=1))
+    return rms
+
+def _pause_midpoints(rms: np.ndarray, hop: int) -> np.ndarray:
+    """Sample index in the middle of every pause, from the RMS of short frames."""
+    silent = (rms < 10 ** (STT_SILENCE_DB / 20)).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], silent, [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    long_enough = ends - starts >= max(1, int(STT_MIN_SILENCE / FRAME_SECONDS))
+    return (starts[long_enough] + ends[long_enough]) // 2 * hop
+
+def split_on_silence(data: bytes, segment_seconds: float = STT_SEGMENT_SECONDS) -> list[tuple[float, bytes]]:
+    """
+    Splits a PCM WAV recording at pauses into WAV pieces of about
+    segment_seconds (at most 1.5x that; cut hard when there's no pause).
+    Returns [(offset in seconds, wav bytes)]. Other formats, and short
+    recordings, come back whole at offset 0.
+    """
+    try:
+        with wave.open(io.BytesIO(data)) as w:
+            params = w.getparams()
+            frames = w.readframes(params.nframes)
+    except (wave.Error, EOFError):
+        return [(0.0, data)]
+
+    rate, width, channels = params.framerate, params.sampwidth, params.nchannels
+    total = len(frames) // (width * channels)
+    if width not in (1, 2, 4) or total <= segment_seconds * 1.5 * rate:
+        return [(0.0, data)]
+
+    samples = np.frombuffer(frames[:total * width * channels], dtype={1: np.uint8, 2: np.int16, 4: np.int32}[width])
+    hop = max(1, int(rate * FRAME_SECONDS))
+    pauses = _pause_midpoints(_frame_rms(samples.reshape(total, channels), hop, width), hop)
+
+    target, longest = int(segment_seconds * rate), int(segment_seconds * 1.5 * rate)
+    bounds, start = [], 0
+    while total - start > longest:
+        nearby = pauses[(pauses >= start + target // 2) & (pauses <= start + longest)]
+        cut = int(nearby[np.argmin(np.abs(nearby - start - target))]) if len(nearby) else start + target
+        bounds.append((start, cut))
+        start = cut
+    bounds.append((start, total))
+
+    pieces = []
+    frame_bytes = width * channels
+    for begin, end in bounds:
+        out = io.BytesIO()
+        with wave.open(out, "wb") as w:
+            w.setnchannels(channels)
+            w.setsampwidth(width)
+            w.setframerate(rate)
+            w.writeframes(frames[begin * frame_bytes:end * frame_bytes])
+        pieces.append((begin / rate, out.getvalue()))
+    return pieces
+
+def _merge_transcriptions(pieces: list, results: list) -> dict:
+    """One transcript, with each piece's segment times moved by its offset."""
+    texts, segments = [], []
+    for (offset, _), result in zip(pieces, results):
+        texts.append(result.text.strip())
+        for segment in getattr(result, "segments", None) or []:
+            segment = dict(segment)
+            segment["id"] = len(segments)
+            for key in ("start", "end"):
+                if key in segment:
+                    segment[key] = round(segment[key] + offset, 3)
+            segments.append(segment)
+    languages = [getattr(result, "language", None) for result in results]
+    return {
+        "text": " ".join(text for text in texts if text),
+        "segments": segments,
+        "language": next((language for language in languages if language), None),
+    }
+
+async def STT(audio_file):
+    """
+    Transcribes an upload without writing it to disk or blocking the event
+    loop. Long WAV recordings are split at pauses and the pieces are sent
+    to the async Groq client concurrently.
+    """
+    data = await _read_upload(audio_file)
+    pieces = await asyncio.to_thread(split_on_silence, data)
+    filename = getattr(audio_file, "filename", None) or "audio.wav"
+    semaphore = asyncio.Semaphore(STT_MAX_CONCURRENCY)
+
+    async def transcribe(i: int, piece: bytes):
+        async with semaphore:
+            return await get_client().audio.transcriptions.create(
+                file=(filename if len(pieces) == 1 else f"segment-{i}.wav", piece),
+                model=STT_MODEL,
+                response_format="verbose_json",
+                temperature=0.0
+            )
+
+    results = await asyncio.gather(*(transcribe(i, piece) for i, (_, piece) in enumerate(pieces)))
+    return _merge_transcriptions(pieces, results)
+
+
+# ==================================================
+# 🗣️ TEXT TO SPEECH
+# ==================================================
+
+# Synthesized audio is kept under outputs/tts_cache, keyed by (text, voice)
+# and capped at TTS_CACHE_MAX_MB; least recently used files go first
+tts_cache = TTSCache(
+    os.getenv("TTS_CACHE_DIR", "outputs/tts_cache"),
+    int(float(os.getenv("TTS_CACHE_MAX_MB", "200")) * 2 ** 20),
+)
+# Seconds Edge TTS may take to produce the first audio before giving up
+TTS_FIRST_AUDIO_TIMEOUT = float(os.getenv("TTS_FIRST_AUDIO_TIMEOUT", "15"))
+TTS_READ_CHUNK_BYTES = 64 * 1024
+
+# Concurrent requests for the same uncached phrase share one synthesis
+_tts_flight = SingleFlight()
+
+metrics.observed("cortex_tts_cache_hits_total", "/tts requests served from the audio cache", "counter",
+                 lambda: tts_cache.hits)
+metrics.observed("cortex_tts_cache_misses_total", "/tts requests synthesized by Edge TTS", "counter",
+                 lambda: tts_cache.misses)
+metrics.observed("cortex_tts_coalesced_total", "/tts misses that joined a synthesis of the same phrase",
+                 "counter", lambda: _tts_flight.coalesced)
+metrics.observed("cortex_tts_cache_bytes", "Bytes of audio in the TTS cache", "gauge",
+                 lambda: tts_cache.stats()["bytes"])
+
+def tts_stats() -> dict:
+    return {**tts_cache.stats(), "coalesced": _tts_flight.coalesced}
+
+async def _synthesize(text: str, voice: str):
+    """Audio chunks from the TTS backend as it produces them."""
+    communicate = get_communicate()(text, voice)
+    # Armed only until the first chunk, so nothing is yielded while it can fire
+    async with asyncio.timeout(TTS_FIRST_AUDIO_TIMEOUT) as first_audio:
+        async for item in communicate.stream():
+            if item["type"] != "audio":
+                continue
+            first_audio.reschedule(None)
+            yield item["data"]
+
+async def _synthesize_to_cache(text: str, voice: str, chunks: asyncio.Queue = None) -> str:
+    """Synthesizes into the cache, also passing each chunk to chunks; returns the file path."""
+    pending = tts_cache.begin(text, voice)
+    try:
+        async for chunk in _synthesize(text, voice):
+            pending.write(chunk)
+            if chunks is not None:
+                chunks.put_nowait(chunk)
+        # May delete evicted files, so it runs off the event loop
+        return await asyncio.to_thread(pending.commit)
+    finally:
+        # Failed: the partial file isn't kept
+        pending.discard()
+
+async def _stream_file(path: str):
+    with open(path, "rb") as f:
+        while chunk := f.read(TTS_READ_CHUNK_BYTES):
+            yield chunk
+
+async def stream_TTS(text: str, voice: str = "en-US-AriaNeural"):
+    """
+    Yields the audio as it is synthesized, and caches it once complete;
+    a cached phrase is read back from disk instead. Raises TimeoutError
+    if no audio arrives within TTS_FIRST_AUDIO_TIMEOUT.
+    """
+    path = tts_cache.get(text, voice)
+    if path is not None:
+        async for chunk in _stream_file(path):
+            yield chunk
+        return
+
+    # Chunks only arrive if this request started the synthesis; one that
+    # joined a synthesis of the same phrase in flight gets none and reads
+    # the file once it is complete. The synthesis finishes (and is cached)
+    # even if this client goes away.
+    chunks = asyncio.Queue()
+    synthesis = asyncio.ensure_future(
+        _tts_flight.do(tts_cache.make_key(text, voice), lambda: _synthesize_to_cache(text, voice, chunks))
+    )
+    synthesis.add_done_callback(lambda _: chunks.put_nowait(None))
+    streamed = False
+    while (chunk := await chunks.get()) is not None:
+        streamed = True
+        yield chunk
+    path = await synthesis
+    if not streamed:
+        async for chunk in _stream_file(path):
+            yield chunk
+
+async def TTS(text: str, voice: str = "en-US-AriaNeural") -> str:
+    """
+    Converts text to speech and returns the path of the audio file in the
+    cache, synthesizing it only if this text and voice aren't cached.
+    """
+    path = tts_cache.get(text, voice)
+    if path is not None:
+        return path
+    return await _tts_flight.do(tts_cache.make_key(text, voice), lambda: _synthesize_to_cache(text, voice))